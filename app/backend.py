@@ -6,6 +6,9 @@
 import app.db.model as db
 import pandas as pd
 from sqlalchemy import select
+import app.frame_cache as frame_cache
+from app.db.bulk_loader import copy_dataframe
+from app.db.frame_reader import read_frame
 
 ''' Provides utility functions for database operations.'''
 
@@ -95,4 +98,49 @@ def clone_group(group, project):
 def remove_dataset_from_project(project, dataset):
     project.datasets.remove(dataset)
     session = inspect(project).session  # Get the session from the project
-    session.commit()
\ No newline at end of file
+    session.commit()
+
+def append_measurements(trial, df):
+    ''' Adds long format readings (datetime, variable, value) to a stored trial.
+        Sensors not yet in the trial are registered, and readings already stored
+        for a sensor and datetime are kept. Only the stored readings within the
+        range of the new ones are read. Returns the number of readings added. '''
+    session = inspect(trial).session
+    df = df.dropna(subset=['value'])
+    if df.empty:
+        return 0
+    sensors = {sensor.name: sensor for sensor in trial.sensors}
+    for name in df['variable'].unique():
+        if name not in sensors:
+            sensors[name] = db.Sensor(name=name)
+            trial.sensors.append(sensors[name])
+    session.flush()
+
+    sensor_ids = {name: sensor.id for name, sensor in sensors.items()}
+    new = pd.DataFrame({'sensor_id': df['variable'].map(sensor_ids).astype('int64'),
+                        'datetime': pd.to_datetime(df['datetime'], utc=True).dt.tz_localize(None),
+                        'value': df['value'].astype('float64')})
+    new = new.drop_duplicates(subset=['sensor_id', 'datetime'])
+    start_datetime = new['datetime'].min().to_pydatetime()
+    end_datetime = new['datetime'].max().to_pydatetime()
+    ids = new['sensor_id'].unique().tolist()
+
+    conn = session.connection()
+    qry = select(db.Measurement.sensor_id, db.Measurement.datetime).where(
+        db.Measurement.sensor_id.in_(ids),
+        db.Measurement.datetime.between(start_datetime, end_datetime))
+    stored = read_frame(conn, qry, dtypes={'datetime': 'datetime64[ns]'})
+    stored_keys = pd.MultiIndex.from_frame(stored[['sensor_id', 'datetime']])
+    new = new[~pd.MultiIndex.from_frame(new[['sensor_id', 'datetime']]).isin(stored_keys)]
+    if new.empty:
+        return 0
+
+    copy_dataframe(conn, db.Measurement.__table__, new)
+    db.refresh_rollups(conn, ids, new['datetime'].min(), new['datetime'].max())
+    if trial.start_datetime is None or start_datetime < trial.start_datetime:
+        trial.start_datetime = start_datetime
+    if trial.end_datetime is None or end_datetime > trial.end_datetime:
+        trial.end_datetime = end_datetime
+    frame_cache.evict_trial_on_commit(session, trial.id)
+    return len(new)
+
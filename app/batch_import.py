@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import io
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from app.file_importer import FileReaderBehaviours, CSVReaderBehaviours, ExcelReaderBehaviours
+from app.staged_readings import get_first_of_repeats
+
+''' Imports many logger files at once with the settings detected on one
+    of them. Files are parsed in a process pool, each into long format
+    readings sorted by datetime and variable, and the sorted frames are
+    merged in a single stable sort that drops repeated readings. '''
+
+# Worker processes used when no count is given
+MAX_WORKERS = 2
+
+CSV_EXTENSIONS = ('.csv', '.txt')
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+
+
+class BatchFileReader(FileReaderBehaviours):
+
+    def __init__(self, filetype_behaviour):
+        self.filetype_behaviour = filetype_behaviour
+
+
+def get_filetype_behaviour(name):
+    ''' The reader behaviour for a file name, or None if it is not supported. '''
+    if name.lower().endswith(CSV_EXTENSIONS):
+        return CSVReaderBehaviours
+    if name.lower().endswith(EXCEL_EXTENSIONS):
+        return ExcelReaderBehaviours
+    return None
+
+def melt_readings(df):
+    ''' Long format UTC readings (datetime, variable, value) of an imported
+        wide frame, sorted by datetime and variable. '''
+    df = df.set_index('datetime').tz_convert('UTC').reset_index()
+    df = df.rename(columns={'value': 'value_'}) # Rename if any columns are named value to avoid conflicts
+    df = df.melt(id_vars='datetime', var_name='variable', value_name='value').dropna(subset=['value'])
+    return df.sort_values(['datetime', 'variable'], kind='stable', ignore_index=True)
+
+def read_readings(name, data, dt_col_indexes, dt_formats, usecol_indexes, skiprows, tz, sheet_name=None):
+    ''' Parses one file's bytes into long format readings. Runs in a worker process. '''
+    reader = BatchFileReader(get_filetype_behaviour(name))
+    kwargs = {} if sheet_name is None else {'sheet_name': sheet_name}
+    df = reader.read_full(io.BytesIO(data), *dt_col_indexes, formats=dt_formats,
+                          usecols=usecol_indexes, skiprows=skiprows, **kwargs)
+    df['datetime'] = df['datetime'].dt.tz_localize(tz)
+    return melt_readings(df)
+
+def merge_readings(frames):
+    ''' Merges sorted long format readings, keeping the first reading of
+        any repeated datetime and variable in the order of the frames. '''
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    codes, _ = pd.factorize(df['variable'])
+    times = df['datetime'].to_numpy(dtype='datetime64[ns]').view('int64')
+    return df.iloc[get_first_of_repeats(times, codes)].reset_index(drop=True)
+
+def import_files(files, dt_col_indexes, dt_formats, usecol_indexes, skiprows, tz,
+                 sheet_name=None, max_workers=MAX_WORKERS):
+    ''' Parses (name, bytes) files concurrently and merges their readings
+        in the order given. Returns the readings and (name, reason) of each
+        file that failed. '''
+    max_workers = max(min(max_workers, len(files)), 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(name, executor.submit(read_readings, name, data, dt_col_indexes, dt_formats,
+                                          usecol_indexes, skiprows, tz, sheet_name))
+                   for name, data in files]
+        frames = []
+        failed = []
+        for name, future in futures:
+            try:
+                frames.append(future.result())
+            except Exception as e:
+                failed.append((name, str(e) or type(e).__name__))
+    return merge_readings(frames), failed
@@ -3,11 +3,94 @@
 @author: Graham.Macleod
 """
 
-from sqlalchemy import func, select, inspect
+import math
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import func, select, inspect, event, and_, or_
+from sqlalchemy.orm import Session
 import pandas as pd
 
 ''' Provides classes for retrieving data for the data_editor
-    displays.'''
+    displays. Pages are found by seeking past the sort value and primary
+    key of the last row of the previous page rather than with OFFSET, so
+    deep pages cost the same as the first. The last row of every page is
+    read in one query over just the key columns, and these bookmarks and
+    the row counts are kept until a session in this process commits, or
+    for at most CACHE_TTL seconds, as other processes and connections may
+    change the tables too. '''
+
+CACHE_SIZE = 256
+CACHE_TTL = 60 # seconds
+
+
+class TimedCache:
+    ''' Least recently used entries that expire ttl seconds after they are stored. '''
+
+    def __init__(self, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict() # {key: (stored time, value)}
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        ''' Returns the value of the key, calling compute() when it is missing or expired. '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                return entry[1]
+        value = compute()
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def discard(self, matches):
+        ''' Removes the entries whose key matches. '''
+        with self.lock:
+            for key in [key for key in self.entries if matches(key)]:
+                del self.entries[key]
+
+
+# Keyed by the database and compiled query, shared between reruns
+row_counts = TimedCache()
+bookmarks = TimedCache()
+
+
+@event.listens_for(Session, 'after_commit')
+def clear_caches(session):
+    row_counts.clear()
+    bookmarks.clear()
+
+def get_query_key(session, qry):
+    ''' Hashable key of the session's database and a query's SQL and parameters. '''
+    url = session.get_bind().engine.url.render_as_string(hide_password=True)
+    compiled = qry.compile()
+    return url, str(compiled), repr(sorted(compiled.params.items()))
+
+def order_by_key(sort_col, pk, ascending):
+    ''' Page order of the sort column then primary key, missing values last. '''
+    if ascending:
+        return [sort_col.is_(None), sort_col.asc(), pk.asc()]
+    return [sort_col.is_(None), sort_col.desc(), pk.desc()]
+
+def after_key(sort_col, pk, ascending, sort_value, pk_value):
+    ''' Rows that come after the given sort value and primary key in page order. '''
+    later = (lambda column, value: column > value) if ascending else (lambda column, value: column < value)
+    if sort_value is None:
+        return and_(sort_col.is_(None), later(pk, pk_value))
+    return or_(sort_col.is_(None),
+               later(sort_col, sort_value),
+               and_(sort_col == sort_value, later(pk, pk_value)))
+
+
 class DatabaseRetriever:
     by = None
     ascending = None
@@ -17,33 +100,52 @@ class DatabaseRetriever:
             raise ValueError("Query must have one and only one table")
         self.table = qry.column_descriptions[0]["entity"]
         self.session = session
-        self.qry = qry
+        self.qry = qry.order_by(None)
         self.options = options
 
     def get_num_pages(self, batch_size):
         row_count = self.get_row_count()
-        return (int(row_count / batch_size) if int(row_count / batch_size) > 0 else 1)
+        return max(math.ceil(row_count / batch_size), 1)
 
     def get_row_count(self):
         qry = select(func.count('*')).select_from(self.qry.subquery())
-        return self.session.execute(qry).scalar()
+        return row_counts.get(get_query_key(self.session, self.qry),
+                              lambda: self.session.execute(qry).scalar())
+
+    def get_sort_key(self):
+        ''' Sort column, primary key and direction of the pages, the first option by default. '''
+        by = self.get_options()[0] if self.by is None else self.by
+        ascending = True if self.ascending is None else self.ascending
+        return getattr(self.table, by), inspect(self.table).primary_key[0], ascending
+
+    def get_bookmarks(self, batch_size):
+        ''' Sort value and primary key of the last row of every full page. '''
+        sort_col, pk, ascending = self.get_sort_key()
+        key = (get_query_key(self.session, self.qry), str(sort_col), ascending, batch_size)
+        row_number = func.row_number().over(order_by=order_by_key(sort_col, pk, ascending))
+        keys = self.qry.with_only_columns(sort_col.label('sort_value'), pk.label('pk'),
+                                          row_number.label('row_number')).subquery()
+        qry = (select(keys.c.sort_value, keys.c.pk)
+               .where(keys.c.row_number % batch_size == 0)
+               .order_by(keys.c.row_number))
+        return bookmarks.get(key, lambda: [tuple(row) for row in self.session.execute(qry)])
 
     def get_page(self, page_num, batch_size):
-        offset = (page_num - 1) * batch_size
-        qry = self.qry
-        if self.by is not None and self.ascending is not None:
-            qry = qry.order_by(
-                getattr(self.table, self.by).asc() 
-                if self.ascending 
-                else getattr(self.table, self.by).desc())
-        qry = qry.offset(offset).limit(batch_size)
-        res = self.session.execute(qry).scalars().all()
-        res = [[getattr(table, opt) for opt in self.options] for table in res]
-        return pd.DataFrame(res, columns=self.options)
+        options = self.get_options()
+        sort_col, pk, ascending = self.get_sort_key()
+        qry = (self.qry.with_only_columns(*[getattr(self.table, opt) for opt in options])
+               .order_by(*order_by_key(sort_col, pk, ascending)))
+        if page_num > 1:
+            page_bookmarks = self.get_bookmarks(batch_size)
+            if page_num - 2 >= len(page_bookmarks):
+                return pd.DataFrame([], columns=options)
+            qry = qry.where(after_key(sort_col, pk, ascending, *page_bookmarks[page_num - 2]))
+        res = self.session.execute(qry.limit(batch_size)).all()
+        return pd.DataFrame(res, columns=options)
 
     def get_options(self):
         if self.options is None:
-            return [column.key for column in self.qry.selected_columns]
+            return [column.key for column in inspect(self.table).mapper.columns]
         return self.options
 
     def set_sort_fields(self, by, ascending):
@@ -51,41 +153,7 @@ class DatabaseRetriever:
         self.ascending = ascending
 
 
-class FullTableDatabaseRetriever:
-    by = None
-    ascending = None
+class FullTableDatabaseRetriever(DatabaseRetriever):
 
     def __init__(self, session, table, options=None):
-        self.session = session
-        self.table = table
-        self.options = options
-
-    def get_num_pages(self, batch_size):
-        row_count = self.get_row_count()
-        return (int(row_count / batch_size) if int(row_count / batch_size) > 0 else 1)
-
-    def get_row_count(self):
-        qry = select(func.count('*')).select_from(self.table)
-        return self.session.execute(qry).scalar()
-
-    def get_page(self, page_num, batch_size):
-        offset = (page_num - 1) * batch_size
-        qry = select(self.table)
-        if self.by is not None and self.ascending is not None:
-            qry = qry.order_by(
-                getattr(self.table, self.by).asc() 
-                if self.ascending 
-                else getattr(self.table, self.by).desc())
-        qry = qry.offset(offset).limit(batch_size)
-        res = self.session.execute(qry).scalars().all()
-        res = [[getattr(table, opt) for opt in self.options] for table in res]
-        return pd.DataFrame(res, columns=self.options)
-
-    def get_options(self):
-        if self.options is None:
-            return [column.key for column in inspect(self.table).mapper.columns]
-        return self.options
-
-    def set_sort_fields(self, by, ascending):
-        self.by = by
-        self.ascending = ascending
+        super().__init__(session, select(table), options)
@@ -3,36 +3,52 @@
 @author: Graham.Macleod
 """
 
-def split_frame(input_df, rows):
-    df = [input_df.loc[i : i + rows - 1, :] for i in range(0, len(input_df), rows)]
-    return df
+import math
 
 ''' Provides classes for retrieving data for the data_editor
-    displays. This one passes a dataframe to the constructor.'''
+    displays. This one passes a dataframe to the constructor.
+    Sorting only orders the row positions of the sort column, and a page
+    is taken from those positions so the frame itself is never copied or
+    re-sorted. Callers that rebuild the retriever on every rerun can pass a
+    cached sort_order so the positions are computed once. '''
+
+def get_sort_order(df, by, ascending):
+    ''' Row positions of the frame in stable order of a column. '''
+    column = df[by].reset_index(drop=True)
+    return column.sort_values(ascending=ascending, kind='stable').index.to_numpy()
+
+
 class DataFrameRetriever:
     by = None
     ascending = None
 
-    def __init__(self, dataset):
+    def __init__(self, dataset, sort_order=get_sort_order):
         self.dataset = dataset
+        self.sort_order = sort_order
 
     def get_num_pages(self, batch_size):
         row_count = self.get_row_count()
-        return (int(row_count / batch_size) if int(row_count / batch_size) > 0 else 1)
+        return max(math.ceil(row_count / batch_size), 1)
 
     def get_row_count(self):
         return len(self.dataset)
 
+    def get_order(self):
+        ''' Row positions in sort order, or None when unsorted. '''
+        if self.by is None or self.ascending is None:
+            return None
+        return self.sort_order(self.dataset, self.by, self.ascending)
+
     def get_page(self, page_num, batch_size):
-        df = self.dataset
-        if self.by is not None and self.ascending is not None:
-            df = df.sort_values(by=self.by, ascending=self.ascending, ignore_index=True)
-        pages = split_frame(df, batch_size)
-        return pages[page_num - 1]
+        start = (page_num - 1) * batch_size
+        order = self.get_order()
+        rows = slice(start, start + batch_size) if order is None else order[start:start + batch_size]
+        # The editor addresses rows by position within the page
+        return self.dataset.iloc[rows].reset_index(drop=True)
 
     def get_options(self):
         return self.dataset.columns
 
     def set_sort_fields(self, by, ascending):
         self.by = by
-        self.ascending = ascending
\ No newline at end of file
+        self.ascending = ascending
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import io
+
+''' Streams dataframes into database tables in fixed size chunks.
+    PostgreSQL connections use COPY FROM STDIN, other dialects fall
+    back to a plain DBAPI executemany of row tuples. '''
+
+CHUNK_SIZE = 100000
+
+
+def gen_chunks(df, chunk_size=CHUNK_SIZE):
+    ''' Yields consecutive row slices of the dataframe without copying it. '''
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+def naive_utc(df):
+    ''' Timezone aware columns of a chunk are converted to UTC and stored
+        without the offset, matching the TIMESTAMP columns of the model. '''
+    for column in df.columns:
+        if getattr(df[column].dtype, 'tz', None) is not None:
+            df = df.assign(**{column: df[column].dt.tz_convert('UTC').dt.tz_localize(None)})
+    return df
+
+def copy_chunk(cursor, table, chunk):
+    ''' Writes one chunk as CSV into an in-memory buffer and COPYs it. '''
+    buffer = io.StringIO()
+    chunk.to_csv(buffer, index=False, header=False, na_rep='',
+                 date_format='%Y-%m-%d %H:%M:%S.%f')
+    buffer.seek(0)
+    columns = ', '.join(chunk.columns)
+    cursor.copy_expert(f"COPY {table.name} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def executemany_chunk(conn, table, chunk):
+    ''' Inserts one chunk as a list of tuples through the DBAPI cursor. '''
+    if conn.dialect.name == 'sqlite':
+        # Match the string storage format used by SQLAlchemy for SQLite datetimes
+        for column in chunk.columns:
+            if chunk[column].dtype.kind == 'M':
+                chunk = chunk.assign(**{column: chunk[column].dt.strftime('%Y-%m-%d %H:%M:%S.%f')})
+    placeholder = '?' if conn.dialect.paramstyle == 'qmark' else '%s'
+    columns = ', '.join(chunk.columns)
+    placeholders = ', '.join([placeholder] * len(chunk.columns))
+    stmt = f"INSERT INTO {table.name} ({columns}) VALUES ({placeholders})"
+    conn.exec_driver_sql(stmt, list(chunk.itertuples(index=False, name=None)))
+
+def copy_dataframe(conn, table, df, chunk_size=CHUNK_SIZE):
+    ''' Bulk loads the dataframe into the table using the connection's
+        current transaction. The dataframe columns must be table columns. '''
+    if conn.dialect.name == 'postgresql':
+        cursor = conn.connection.cursor()
+        try:
+            for chunk in gen_chunks(df, chunk_size):
+                copy_chunk(cursor, table, naive_utc(chunk))
+        finally:
+            cursor.close()
+    else:
+        for chunk in gen_chunks(df, chunk_size):
+            executemany_chunk(conn, table, naive_utc(chunk))
+    return len(df)
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import pandas as pd
+
+''' Reads the results of SQLAlchemy statements into typed dataframes.
+    Statements are executed with their bound parameters so the compiled
+    form is cached, and rows are streamed from a server side cursor in
+    chunks that are typed as they arrive. '''
+
+CHUNK_SIZE = 100000
+
+
+def read_frame(conn, qry, dtypes=None, chunksize=CHUNK_SIZE):
+    ''' Executes the statement on the connection and returns a dataframe. '''
+    qry = qry.execution_options(stream_results=True, max_row_buffer=chunksize)
+    chunks = [chunk if dtypes is None else chunk.astype(dtypes)
+              for chunk in pd.read_sql(qry, conn, chunksize=chunksize)]
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
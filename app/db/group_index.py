@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+from itertools import chain
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.database_retriever import TimedCache
+
+''' Sensor group membership of a project. Groups list sensor display
+    names, which are matched to the sensors of each trial in the project.
+    The index is built once per project and database and kept for a while,
+    so the group and plot pages do not walk the groups on every rerun. A
+    flush that touches a group, sensor, dataset or project records the
+    projects it can change, and their indexes are evicted once the session
+    commits, so an index read by another session in the meantime is not
+    kept. Every index is dropped when a session rolls back. '''
+
+# Flushes of these classes can change a membership
+SOURCE_CLASSES = {'Project', 'Dataset', 'Trial', 'Sensor', 'Group', 'GroupSensorName'}
+
+# Session.info key of the projects to evict when the session commits, None for all of them
+PENDING_KEY = 'group_index_projects'
+
+# Keyed by database URL and project id
+indexes = TimedCache(max_size=64, ttl=300)
+
+
+class GroupIndex:
+
+    def __init__(self, groups, members, sensors):
+        self.groups = groups # {group id: (key, value)}
+        self.members = members # {group id: tuple of display names}
+        self.sensors = sensors # {trial id: {display name: sensor id}}
+        self.group_ids = {group: group_id for group_id, group in groups.items()}
+
+    def get_group_id(self, key, value):
+        return self.group_ids.get((key, value))
+
+    def get_group_ids(self, key):
+        return [group_id for group_id, (group_key, _) in self.groups.items() if group_key == key]
+
+    def get_group_values(self, key):
+        return [self.groups[group_id][1] for group_id in self.get_group_ids(key)]
+
+    def get_filter_options(self):
+        ''' Group keys and the values of each key. '''
+        options = list(dict.fromkeys(key for key, _ in self.groups.values()))
+        return options, {key: self.get_group_values(key) for key in options}
+
+    def get_sensor_names(self, group_id):
+        return self.members.get(group_id, ())
+
+    def get_sensor_ids(self, group_id, trial_id):
+        ''' Ids of the trial's sensors in the group. '''
+        trial_sensors = self.sensors.get(trial_id, {})
+        return [trial_sensors[name] for name in self.get_sensor_names(group_id) if name in trial_sensors]
+
+    def get_key_sensor_ids(self, key, trial_id):
+        ''' Ids of the trial's sensors in any group of the key. '''
+        return list(dict.fromkeys(chain.from_iterable(
+            self.get_sensor_ids(group_id, trial_id) for group_id in self.get_group_ids(key))))
+
+    def get_unassigned_sensor_names(self, key):
+        ''' Display names of the project's sensors not in any group of the key. '''
+        assigned = set(chain.from_iterable(self.get_sensor_names(group_id) for group_id in self.get_group_ids(key)))
+        names = set(chain.from_iterable(trial_sensors.keys() for trial_sensors in self.sensors.values()))
+        return sorted(names - assigned)
+
+    def gen_memberships(self, trial_id):
+        ''' (group id, key, value, display name) of every grouped sensor of the trial. '''
+        trial_sensors = self.sensors.get(trial_id, {})
+        for group_id, (key, value) in self.groups.items():
+            for name in self.get_sensor_names(group_id):
+                if name in trial_sensors:
+                    yield group_id, key, value, name
+
+
+def get_database_url(bind):
+    return bind.engine.url.render_as_string(hide_password=True)
+
+def cached_index(bind, project_id, build):
+    ''' Returns the project's index, calling build() on a miss. '''
+    return indexes.get((get_database_url(bind), project_id), build)
+
+def get_project_ids(obj):
+    ''' Ids of the projects whose membership the object can change, or None for any project. '''
+    name = obj.__class__.__name__
+    if name == 'Project':
+        return {obj.id}
+    if name == 'Group' and obj.project_id is not None:
+        return {obj.project_id}
+    if name == 'Dataset':
+        # Added, kept and removed projects, empty when they were never loaded
+        projects = list(chain.from_iterable(inspect(obj).attrs.projects.history))
+        if projects:
+            return {project.id for project in projects}
+    return None
+
+@event.listens_for(Session, "after_flush")
+def record_on_flush(session, flush_context):
+    # The flushed objects are still listed here
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if obj.__class__.__name__ in SOURCE_CLASSES:
+            project_ids = get_project_ids(obj)
+            pending = session.info.get(PENDING_KEY, set())
+            if project_ids is None or pending is None:
+                session.info[PENDING_KEY] = None
+                return
+            session.info[PENDING_KEY] = pending | project_ids
+
+@event.listens_for(Session, "after_commit")
+def evict_on_commit(session):
+    if PENDING_KEY not in session.info:
+        return
+    project_ids = session.info.pop(PENDING_KEY)
+    url = get_database_url(session.get_bind())
+    indexes.discard(lambda key: key[0] == url and (project_ids is None or key[1] in project_ids))
+
+@event.listens_for(Session, "after_rollback")
+def clear_on_rollback(session):
+    # An index built inside the transaction may hold flushed changes that were rolled back
+    session.info.pop(PENDING_KEY, None)
+    indexes.clear()
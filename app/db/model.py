@@ -4,22 +4,69 @@
 """
 
 import io
+import numpy as np
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image as PImage
 import pandas as pd
 from sqlalchemy import Column, TIMESTAMP, String, Table, ForeignKey, \
                         Integer, Sequence, func, LargeBinary, \
                         PrimaryKeyConstraint, FLOAT,  event, select, \
-                        and_, inspect, UniqueConstraint, CheckConstraint, \
-                        delete, text
-from sqlalchemy.orm import DeclarativeBase, relationship, backref
+                        inspect, UniqueConstraint, CheckConstraint, \
+                        delete, or_, insert, update, distinct
+from sqlalchemy.orm import DeclarativeBase, relationship, backref, column_property
 from app.plot_behaviours import VisualisationBehaviour
 import app.db.trial_sensor_handler as trial_sensor_handler # do not delete
+from app.db.bulk_loader import copy_dataframe
+from app.db.frame_reader import read_frame
+import app.frame_cache as frame_cache
+import app.db.rollups as rollups
+import app.db.group_index as group_index
+import app.geocoder as geocoder
+from app.wide_frame import make_wide_frame, get_sensor_label
 from sqlalchemy.sql.functions import coalesce
 
 ''' Defines the Entity Relationship model for the database
     and adds the methods and behaviours required for the 
     python objects created by the ORM.'''
 
+MEASUREMENT_DTYPES = {'datetime': 'datetime64[ns]', 'variable': str, 'value': 'float32'}
+
+# Datasets of a project read at once, each on its own pooled connection
+PROJECT_READ_WORKERS = 4
+
+
+def get_sensors_stamp(sensors):
+    ''' The sensor ids and names that determine a measurement dataframe. '''
+    return tuple(sorted((sensor.id, sensor.name, sensor.display_name) for sensor in sensors))
+
+def get_data_stamp(session, sensors):
+    ''' Reading count and last day of the sensors, read from the daily rollups.
+        Adding readings from any process changes it. '''
+    qry = select(func.sum(MeasurementRollup.value_count), func.max(MeasurementRollup.bucket)).where(
+                MeasurementRollup.sensor_id.in_([sensor.id for sensor in sensors]),
+                MeasurementRollup.resolution == '1d')
+    return tuple(session.execute(qry).one())
+
+def get_filter_mask(filter, sensors, index, trial_id):
+    ''' Which of the trial's sensors pass a group, sensor or reference filter. '''
+    key, value = filter['selected_key'], filter['selected_value']
+    if filter['filter_type'] == 'group_filter':
+        group_id = index.get_group_id(key, value)
+        member_ids = [] if group_id is None else index.get_sensor_ids(group_id, trial_id)
+        return np.isin([sensor.id for sensor in sensors], member_ids)
+    matches = np.array([getattr(sensor, key) == value for sensor in sensors], dtype=bool)
+    if filter['filter_type'] == 'reference_filter':
+        return ~matches
+    return matches
+
+def get_exclusion_sensor_ids(names, sensor_ids):
+    ''' Sorted ids of the named sensors, or of every sensor when no names are given. '''
+    if names is None or (isinstance(names, float) and pd.isna(names)):
+        return sorted(sensor_ids.values())
+    return sorted({sensor_ids[name] for name in names if name in sensor_ids})
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -60,15 +107,35 @@ class Project(Base):
     notes = Column(String)
 
     def get_dataframe(self):
-        dataframes = []
-        for dataset in self.datasets:
-            trial_df = dataset.trial.get_dataframe()
-            trial_df['trial'] = dataset.trial.name
-            trial_df['dataset'] = dataset.name
-            dataframes.append(trial_df)
-        df = pd.concat(dataframes, axis=0)
-        df = df.pivot(index=['datetime', 'trial', 'dataset'], columns='variable', values='value')
-        return df.reset_index()
+        ''' Readings of every dataset with one column per sensor label. The
+            datasets are read concurrently on their own connections, so they
+            see committed data only, and joined column by column. '''
+        engine = inspect(self).session.get_bind()
+        datasets = list(self.datasets)
+        sources = [dataset.get_frame_source(dataset.sensors) for dataset in datasets]
+
+        def read(source):
+            key, qry = source
+            def read_qry():
+                with engine.connect() as conn:
+                    return read_frame(conn, qry, dtypes=MEASUREMENT_DTYPES)
+            return frame_cache.cached_frame(key, read_qry)
+
+        with ThreadPoolExecutor(max_workers=max(min(len(sources), PROJECT_READ_WORKERS), 1)) as executor:
+            frames = list(executor.map(read, sources))
+        wides = [make_wide_frame(df, list(dict.fromkeys(get_sensor_label(sensor) for sensor in dataset.sensors)))
+                 for dataset, df in zip(datasets, frames)]
+
+        lengths = [len(wide) for wide in wides]
+        columns = {'datetime': np.concatenate([wide.index.to_numpy() for wide in wides] or
+                                              [np.array([], dtype='datetime64[ns]')]),
+                   'trial': np.repeat([dataset.trial.name for dataset in datasets], lengths),
+                   'dataset': np.repeat([dataset.name for dataset in datasets], lengths)}
+        for label in sorted(set().union(*[wide.columns for wide in wides])):
+            columns[label] = np.concatenate([wide[label].to_numpy() if label in wide.columns
+                                             else np.full(len(wide), np.nan, dtype='float32')
+                                             for wide in wides])
+        return pd.DataFrame(columns)
 
     def get_datasets_dataframe(self):
         tuples = [(dataset.name, dataset.start_datetime, dataset.end_datetime, dataset.trial.name)
@@ -77,8 +144,9 @@ class Project(Base):
         return pd.DataFrame(tuples, columns=columns)
 
     def get_group_display_df(self):
-        tuples = [(group.key, group.value, group.get_sensor_names())
-                    for group in self.groups]
+        index = self.get_group_index()
+        tuples = [(key, value, index.get_sensor_names(group_id))
+                    for group_id, (key, value) in index.groups.items()]
         columns = ['key', 'value', 'sensors']
         return pd.DataFrame(tuples, columns=columns)
 
@@ -87,11 +155,43 @@ class Project(Base):
         qry = select(Sensor).join(Trial).join(Dataset).where(Dataset.id.in_(dataset_ids))
         return inspect(self).session.execute(qry).scalars().all()
 
+    def build_group_index(self):
+        ''' Reads the group memberships and the display names of the project's sensors. '''
+        session = inspect(self).session
+        qry = select(Group.id, Group.key, Group.value, GroupSensorName.name).outerjoin(
+                    sensor_group_association,
+                    onclause=(sensor_group_association.c.group_id == Group.id)
+                    ).outerjoin(
+                    GroupSensorName,
+                    onclause=(GroupSensorName.id == sensor_group_association.c.sensor_id)
+                    ).where(
+                    Group.project_id == self.id).order_by(Group.id, GroupSensorName.name)
+        groups, members = {}, {}
+        for group_id, key, value, name in session.execute(qry):
+            groups[group_id] = (key, value)
+            names = members.setdefault(group_id, [])
+            if name is not None:
+                names.append(name)
+        qry = select(Sensor.trial_id, Sensor.id, Sensor.name, Sensor.display_name).join(
+                    Dataset, onclause=(Dataset.trial_id == Sensor.trial_id)
+                    ).join(
+                    project_datasets_association,
+                    onclause=(project_datasets_association.c.dataset_id == Dataset.id)
+                    ).where(
+                    project_datasets_association.c.project_id == self.id).distinct()
+        sensors = {}
+        for trial_id, sensor_id, name, display_name in session.execute(qry):
+            display_name = name if display_name == '' or display_name is None else display_name
+            sensors.setdefault(trial_id, {})[display_name] = sensor_id
+        return group_index.GroupIndex(groups, {group_id: tuple(names) for group_id, names in members.items()},
+                                      sensors)
+
+    def get_group_index(self):
+        ''' The cached sensor group membership of the project. '''
+        return group_index.cached_index(inspect(self).session.get_bind(), self.id, self.build_group_index)
+
     def gen_sensors(self, dataset):
-        for group in self.groups:
-            for sensor in group.sensors:
-                if sensor in dataset.trial.sensors:
-                    yield group.id, group.key, group.value, sensor.name
+        yield from self.get_group_index().gen_memberships(dataset.trial_id)
 
     def get_group_df(self, dataset):
         ''' group metadata dataframe '''
@@ -100,21 +200,80 @@ class Project(Base):
         return pd.DataFrame(tuples, columns=columns)
 
     def get_group_values(self, key):
-        return [group.value for group in self.groups if group.key == key]
+        return self.get_group_index().get_group_values(key)
 
     def get_unassigned_sensor_names(self, key):
-        assigned_sensor_names_lists = [group.get_sensor_names() for group in self.groups if group.key == key]
-        assigned_sensor_names = [item for sublist in assigned_sensor_names_lists for item in sublist]
-        unassigned_sensor_names = [sensor.get_display_name() for sensor in self.get_sensors() if
-                            sensor.get_display_name() not in assigned_sensor_names]
-        return list(set(unassigned_sensor_names))
+        return self.get_group_index().get_unassigned_sensor_names(key)
 
     def get_filter_options(self):
-        options = list(set([group.key for group in self.groups]))
-        key_to_values = {key: [group.value for group in self.groups if group.key == key] for key in options}
-        return options, key_to_values
+        return self.get_group_index().get_filter_options()
 
-class Trial(Base):
+class AggregateBehaviour:
+    ''' Bucketed summaries of the readings of a Trial or Dataset. Whole
+        buckets of the coarsest suitable rollup are read from the rollup
+        table. Readings in the partial buckets at either end of the range,
+        and readings of sensors that cannot use the rollups, are summarised
+        from the raw measurements. '''
+
+    def get_aggregates(self, sensors, freq, start_datetime=None, end_datetime=None):
+        session = inspect(self).session
+        if start_datetime is None or end_datetime is None:
+            start_datetime, end_datetime = self.start_datetime, self.end_datetime
+        resolution = rollups.choose_resolution(freq)
+        rollup_sensors = []
+        if resolution is not None:
+            full_start, full_end = rollups.get_full_range(start_datetime, end_datetime, resolution)
+            if full_start < full_end:
+                rollup_sensors = self.get_rollup_sensors(sensors)
+        raw_sensors = [sensor for sensor in sensors if sensor not in rollup_sensors]
+        # Buckets that do not tile a day are counted from the day of the first reading, as resample does
+        origin = None if rollups.divides_day(freq) else self.get_first_day(sensors, start_datetime, end_datetime)
+
+        frames = []
+        if rollup_sensors:
+            labels = {sensor.id: get_sensor_label(sensor) for sensor in rollup_sensors}
+            stats = [getattr(MeasurementRollup, column) for column in rollups.STAT_COLUMNS]
+            qry = select(MeasurementRollup.sensor_id, MeasurementRollup.bucket.label('datetime'), *stats).where(
+                MeasurementRollup.sensor_id.in_(list(labels)),
+                MeasurementRollup.resolution == resolution,
+                MeasurementRollup.bucket >= full_start,
+                MeasurementRollup.bucket < full_end)
+            df = read_frame(session.connection(), qry, dtypes={'datetime': 'datetime64[ns]'})
+            df.insert(0, 'variable', df.pop('sensor_id').map(labels))
+            frames.append(df)
+            # Partial buckets at the ends of the range
+            qry = self.make_meas_query(rollup_sensors, start_datetime, end_datetime).where(
+                or_(Measurement.datetime < full_start, Measurement.datetime >= full_end))
+            df = read_frame(session.connection(), qry, dtypes=MEASUREMENT_DTYPES)
+            frames.append(rollups.summarise(df, ['variable'], freq, origin))
+        if raw_sensors:
+            qry = self.make_meas_query(raw_sensors, start_datetime, end_datetime)
+            df = read_frame(session.connection(), qry, dtypes=MEASUREMENT_DTYPES)
+            frames.append(rollups.summarise(df, ['variable'], freq, origin))
+        if not frames:
+            return pd.DataFrame(columns=['variable', 'datetime'] + rollups.STAT_COLUMNS)
+        df = rollups.merge_summaries(pd.concat(frames, ignore_index=True), ['variable'], freq, origin)
+        return df.sort_values(['variable', 'datetime'], ignore_index=True)
+
+    def get_first_day(self, sensors, start_datetime, end_datetime):
+        ''' Midnight of the day of the first reading in the range, or None without readings. '''
+        readings = self.make_meas_query(sensors, start_datetime, end_datetime).order_by(None).subquery()
+        first = inspect(self).session.execute(select(func.min(readings.c.datetime))).scalar()
+        return None if first is None else pd.Timestamp(first).floor('1D')
+
+    def get_sample_interval(self, sensors):
+        ''' Mean number of seconds between the distinct times of the readings. '''
+        readings = self.make_meas_query(sensors).order_by(None).subquery()
+        qry = select(func.count(distinct(readings.c.datetime)),
+                     func.min(readings.c.datetime),
+                     func.max(readings.c.datetime))
+        count, first, last = inspect(self).session.execute(qry).one()
+        if count < 2:
+            return float('nan')
+        return (pd.Timestamp(last) - pd.Timestamp(first)).total_seconds() / (count - 1)
+
+
+class Trial(Base, AggregateBehaviour):
     _dataframe = None
     _readings_map = None
     __tablename__ = 'trial'
@@ -125,6 +284,9 @@ class Trial(Base):
     end_datetime = Column(TIMESTAMP)
     greenhouse_name = Column(String)
     postcode = Column(String)
+    # Coordinates of the postcode, stored so pages do not geocode on every rerun
+    latitude = Column(FLOAT)
+    longitude = Column(FLOAT)
 
     @property
     def dataframe(self):
@@ -137,10 +299,14 @@ class Trial(Base):
             if not isinstance(df, pd.DataFrame):
                 raise TypeError("Dataframe must be of type pandas.DataFrame.")
             df["datetime"] = df["datetime"].astype("datetime64[ns, UTC]")
-            df["variable"] = df["variable"].astype("string")
-            df["value"] = df["value"].astype("float64")
-            self.start_datetime = df['datetime'].min()
-            self.end_datetime = df['datetime'].max()
+            # Staged readings arrive with categorical variables and float32 values, kept as they are
+            if not isinstance(df["variable"].dtype, pd.CategoricalDtype):
+                df["variable"] = df["variable"].astype("string")
+            if df["value"].dtype.kind != 'f':
+                df["value"] = df["value"].astype("float64")
+            # Stored as naive UTC, like the TIMESTAMP columns read back from the database
+            self.start_datetime = df['datetime'].min().tz_convert(None).to_pydatetime()
+            self.end_datetime = df['datetime'].max().tz_convert(None).to_pydatetime()
             self._dataframe = df
         except:
             raise TypeError("Not all the incoming data were of the correct type.")
@@ -160,17 +326,49 @@ class Trial(Base):
         assert all(str(df[col].dtype) == dtype for col, dtype in expected_schema.items()), assert_fail_string
         self._readings_map = df
 
-    def get_dataframe(self, sensors=None):
-        sensor_names = [sensor.name for sensor in sensors]
-        session = inspect(self).session
-        qry = select(Measurement.datetime, coalesce(Sensor.display_name, Measurement.variable).label("variable"),
-                    Measurement.value, Measurement.trial).join(
-                        Sensor, onclause=(Measurement.variable == Sensor.name)
+    def set_postcode(self, postcode):
+        ''' Changes the postcode and stores its coordinates, None if it cannot be found. '''
+        self.postcode = postcode
+        self.latitude, self.longitude = geocoder.get_coordinates(postcode)
+
+    def make_meas_query(self, sensors, start_datetime=None, end_datetime=None):
+        sensor_ids = [sensor.id for sensor in sensors]
+        qry = select(Measurement.datetime, coalesce(Sensor.display_name, Sensor.name).label("variable"),
+                    Measurement.value, Sensor.trial_id.label("trial")).join(
+                        Sensor, onclause=(Measurement.sensor_id == Sensor.id)
                         ).where(
-                    Measurement.trial == self.id).where(
-                    Measurement.variable.in_(sensor_names)).order_by(Measurement.datetime)
-        res = session.execute(qry)
-        return pd.DataFrame(res.fetchall(), columns=res.keys())
+                    Sensor.trial_id == self.id).where(
+                    Measurement.sensor_id.in_(sensor_ids)).order_by(Measurement.datetime)
+        if start_datetime is not None and end_datetime is not None:
+            qry = qry.where(Measurement.datetime.between(start_datetime, end_datetime))
+        return qry
+
+    def get_rollup_sensors(self, sensors):
+        return list(sensors)
+
+    def get_dataframe(self, sensors=None, start_datetime=None, end_datetime=None):
+        ''' Readings of the selected sensors, optionally limited to a time window. '''
+        session = inspect(self).session
+        qry = self.make_meas_query(sensors, start_datetime, end_datetime)
+        key = frame_cache.make_key(session.get_bind(), self.id, 'trial', get_sensors_stamp(sensors),
+                                   get_data_stamp(session, sensors),
+                                   self.start_datetime, self.end_datetime,
+                                   start_datetime, end_datetime)
+        return frame_cache.cached_frame(key, lambda: read_frame(
+            session.connection(), qry, dtypes=MEASUREMENT_DTYPES))
+
+    def insert_dataframe(self, conn):
+        ''' Bulk loads the readings once the trial sensors have been given ids. '''
+        df = self.dataframe
+        sensor_ids = {sensor.name: sensor.id for sensor in self.sensors}
+        df = pd.DataFrame({'sensor_id': df['variable'].map(sensor_ids).astype('float64'),
+                           'datetime': df['datetime'],
+                           'value': df['value'].astype('float64')}).dropna(subset=['sensor_id'])
+        df['sensor_id'] = df['sensor_id'].astype('int64')
+        copy_dataframe(conn, Measurement.__table__, df)
+        copy_dataframe(conn, MeasurementRollup.__table__, rollups.build_rollups(df))
+        self._dataframe = None
+        print('Successfully committed trial data.')
 
 
     def get_files_dataframe(self):
@@ -199,21 +397,20 @@ class Trial(Base):
                 sensor = Sensor(name=row['name'], 
                                 display_name=row['display_name'],)
                 self.sensors.append(sensor)
-
-@event.listens_for(Trial, 'after_insert')
-def receive_before_insert(mapper, conn, target):
-    ''' Insert the dataframe into the measurements database just after the trial is inserted. '''
-    df = target.dataframe
-    if df is not None:
-        df['trial'] = target.id
-        conn.execute(Measurement.__table__.insert(), df.to_dict(orient="records"))
-        print('Successfully committed trial data.')
+        session = inspect(self).session
+        if self.id is not None and session is not None:
+            frame_cache.evict_trial_on_commit(session, self.id)
 
 @event.listens_for(Trial, 'before_delete')
-def receive_before_insert(mapper, conn, target):
+def receive_before_delete(mapper, conn, target):
     session = inspect(target).session
-    stmt = delete(Measurement).where(Measurement.trial == target.id)
+    # The sensors have already been detached from the trial in the database at this point
+    trial_sensor_ids = [sensor.id for sensor in target.sensors]
+    stmt = delete(Measurement).where(Measurement.sensor_id.in_(trial_sensor_ids))
     session.execute(stmt)
+    stmt = delete(MeasurementRollup).where(MeasurementRollup.sensor_id.in_(trial_sensor_ids))
+    session.execute(stmt)
+    frame_cache.evict_trial_on_commit(session, target.id)
     print('Successfully deleted trial data.')
 
 
@@ -276,11 +473,10 @@ class Group(Base):
         self.sensor_name_objects = sensor_name_objects
 
     def get_sensor_ids(self, dataset):
-        sensor_names = self.get_sensor_names()
-        return [sensor.id for sensor in dataset.sensors if sensor.get_display_name() in sensor_names]
+        return self.project.get_group_index().get_sensor_ids(self.id, dataset.trial_id)
 
 
-class Dataset(Base):
+class Dataset(Base, AggregateBehaviour):
     __tablename__ = 'dataset'
     id = Column(Integer, Sequence('dataset_id_seq'),  primary_key=True)
     name = Column(String, unique=True)
@@ -291,15 +487,14 @@ class Dataset(Base):
 
     trial = relationship("Trial", backref='datasets')
     projects = relationship("Project", backref='datasets', secondary=project_datasets_association)
+    # A column expression so retrievers can select and sort on it without loading the trial
+    trial_name = column_property(select(Trial.name).where(Trial.id == trial_id).scalar_subquery(),
+                                 deferred=True)
 
     @property
     def sensors(self):
         return self.trial.sensors
 
-    @property
-    def trial_name(self):
-        return self.trial.name
-
     def get_grouped_df(self, groups):
         ''' Get the dataframe for the selected groups. '''
         session = inspect(self).session
@@ -315,74 +510,155 @@ class Dataset(Base):
         return pd.merge(df, group_map_df, left_on='variable', right_on='name', how='left')
 
 
+    def get_sensor_ids_by_name(self):
+        ''' Ids of the trial sensors keyed by display name. '''
+        return {sensor.get_display_name(): sensor.id for sensor in self.trial.sensors}
+
+    def get_exclusion_rows(self):
+        ''' Stored start, end and sorted sensor ids of each exclusion, read in one query. '''
+        session = inspect(self).session
+        qry = select(Exclusion.id, Exclusion.start_datetime, Exclusion.end_datetime,
+                     exclusion_sensor_association.c.sensor_id).outerjoin(
+                        exclusion_sensor_association,
+                        onclause=(exclusion_sensor_association.c.exclusion_id == Exclusion.id)
+                        ).where(
+                    Exclusion.dataset_id == self.id).order_by(
+                    Exclusion.id, exclusion_sensor_association.c.sensor_id)
+        exclusions = {}
+        for row in session.execute(qry):
+            _, _, sensor_ids = exclusions.setdefault(row.id, (row.start_datetime, row.end_datetime, []))
+            if row.sensor_id is not None:
+                sensor_ids.append(row.sensor_id)
+        return exclusions
+
     def get_exclusions_df(self, view_col=False):
-        tuples = [(exclusion.id, [sensor.get_display_name() for sensor in exclusion.sensors], 
-                   exclusion.start_datetime, exclusion.end_datetime)
-                for exclusion in self.exclusions]
+        names = {sensor_id: name for name, sensor_id in self.get_sensor_ids_by_name().items()}
+        tuples = [(id, [names[sensor_id] for sensor_id in sensor_ids], start_datetime, end_datetime)
+                for id, (start_datetime, end_datetime, sensor_ids) in self.get_exclusion_rows().items()]
         columns = ['id', 'sensors', 'start_datetime', 'end_datetime']
         df = pd.DataFrame(tuples, columns=columns)
         if view_col:
             df['view'] = False
         return df
 
-    def update_exclusions(self, df):
-        for row in df.reset_index().to_dict(orient='records'):
-            id = row['id']
-            session = inspect(self).session
-            qry = select(Exclusion).where(Exclusion.id == id)
-            exclusion = session.execute(qry).scalar()
-            exclusion.check_update(row)
-
-    def remove_exclusions(self, df):
-        for row in df.reset_index().to_dict(orient='records'):
-            id = row['id']
-            session = inspect(self).session
-            qry = select(Exclusion).where(Exclusion.id == id)
-            exclusion = session.execute(qry).scalar()
-            session.delete(exclusion)
-
-    def add_new_exclusions(self, df):
-        for row in df.reset_index().to_dict(orient='records'):
-            if row['sensors'] is None:
-                sensor_names = [sensor.name for sensor in self.trial.sensors]
-            else:
-                sensor_names = row['sensors']
-            sensors = [sensor for sensor in self.trial.sensors if sensor.get_display_name() in sensor_names]
-            exclusion = Exclusion(start_datetime=row['start_datetime'], 
-                                  end_datetime=row['end_datetime'],
-                                  sensors=sensors)
-            self.exclusions.append(exclusion)
-
-    def make_meas_query(self, sensors):
+    def update_exclusions(self, rows, stored, sensor_ids):
+        ''' Updates the changed times and sensors of stored exclusions in bulk. '''
+        session = inspect(self).session
+        times, sensor_links, resensored_ids = [], [], []
+        for row in rows:
+            id = int(row['id'])
+            start_datetime, end_datetime, stored_sensor_ids = stored[id]
+            if (start_datetime, end_datetime) != (row['start_datetime'], row['end_datetime']):
+                times.append({'id': id,
+                              'start_datetime': pd.Timestamp(row['start_datetime']).to_pydatetime(),
+                              'end_datetime': pd.Timestamp(row['end_datetime']).to_pydatetime()})
+            row_sensor_ids = get_exclusion_sensor_ids(row['sensors'], sensor_ids)
+            if row_sensor_ids != stored_sensor_ids:
+                resensored_ids.append(id)
+                sensor_links += [{'exclusion_id': id, 'sensor_id': sensor_id} for sensor_id in row_sensor_ids]
+        if times:
+            session.execute(update(Exclusion), times)
+        if resensored_ids:
+            session.execute(delete(exclusion_sensor_association).where(
+                exclusion_sensor_association.c.exclusion_id.in_(resensored_ids)))
+        if sensor_links:
+            session.execute(insert(exclusion_sensor_association), sensor_links)
+
+    def remove_exclusions(self, ids):
+        ''' Deletes stored exclusions and their sensor links in bulk. '''
+        if not ids:
+            return
+        session = inspect(self).session
+        session.execute(delete(exclusion_sensor_association).where(
+            exclusion_sensor_association.c.exclusion_id.in_(ids)))
+        session.execute(delete(Exclusion).where(Exclusion.id.in_(ids)))
+
+    def add_new_exclusions(self, rows, sensor_ids):
+        ''' Inserts new exclusions and their sensor links in bulk. '''
+        if not rows:
+            return
+        session = inspect(self).session
+        values = [{'dataset_id': self.id,
+                   'start_datetime': pd.Timestamp(row['start_datetime']).to_pydatetime(),
+                   'end_datetime': pd.Timestamp(row['end_datetime']).to_pydatetime()}
+                  for row in rows]
+        # Returned rows are matched back by their times, as their order is not guaranteed
+        row_sensor_ids = {}
+        for value, row in zip(values, rows):
+            key = (value['start_datetime'], value['end_datetime'])
+            row_sensor_ids.setdefault(key, []).append(get_exclusion_sensor_ids(row['sensors'], sensor_ids))
+        inserted = session.execute(insert(Exclusion).returning(
+            Exclusion.id, Exclusion.start_datetime, Exclusion.end_datetime), values)
+        sensor_links = [{'exclusion_id': id, 'sensor_id': sensor_id}
+                        for id, start_datetime, end_datetime in inserted
+                        for sensor_id in row_sensor_ids[(start_datetime, end_datetime)].pop()]
+        if sensor_links:
+            session.execute(insert(exclusion_sensor_association), sensor_links)
+
+    def make_meas_query(self, sensors, start_datetime=None, end_datetime=None):
         # Get all measurements for the dataset's trial       
-        sql_query = select(Measurement.datetime, coalesce(Sensor.display_name, Measurement.variable).label("variable"),
-            Measurement.value, Measurement.trial).join(
-                Sensor, onclause=(Measurement.variable == Sensor.name)
+        sql_query = select(Measurement.datetime, coalesce(Sensor.display_name, Sensor.name).label("variable"),
+            Measurement.value, Sensor.trial_id.label("trial")).join(
+                Sensor, onclause=(Measurement.sensor_id == Sensor.id)
                 ).where(
-            Measurement.trial == self.trial.id).order_by(Measurement.datetime)
+            Sensor.trial_id == self.trial.id).order_by(Measurement.datetime)
         # Only between the start and end datetime of the dataset
         sql_query = sql_query.where(Measurement.datetime.between(self.start_datetime, self.end_datetime))
+        # Optionally narrowed further to a window within the dataset
+        if start_datetime is not None and end_datetime is not None:
+            sql_query = sql_query.where(Measurement.datetime.between(start_datetime, end_datetime))
         # Only for the selected sensors
-        sql_query = sql_query.where(Measurement.variable.in_([sensor.name for sensor in sensors]))
-        # Exclude the measurements that are in the exclusion ranges
-        for exclusion in self.exclusions:
-            for sensor in exclusion.sensors:
-                variable_name = sensor.name
-                start, end = exclusion.start_datetime, exclusion.end_datetime
-                my_filter = and_(Measurement.variable == variable_name, Measurement.datetime.between(start, end))
-                sql_query = sql_query.where(~my_filter)
+        sql_query = sql_query.where(Measurement.sensor_id.in_([sensor.id for sensor in sensors]))
+        # Exclude the measurements that are in the exclusion ranges, as a single anti-join
+        # against the stored exclusions rather than one clause per exclusion and sensor
+        excluded = select(Exclusion.id).join(
+            exclusion_sensor_association,
+            onclause=(exclusion_sensor_association.c.exclusion_id == Exclusion.id)
+            ).where(
+            Exclusion.dataset_id == self.id,
+            exclusion_sensor_association.c.sensor_id == Measurement.sensor_id,
+            Measurement.datetime.between(Exclusion.start_datetime, Exclusion.end_datetime))
+        sql_query = sql_query.where(~excluded.exists())
         # Return the statement as a string
         return sql_query
 
-    def get_dataframe(self, sensors=None):
+    def get_exclusions_stamp(self):
+        ''' Summarises the stored exclusions of the dataset in one query. '''
         session = inspect(self).session
+        qry = select(Exclusion.id, Exclusion.start_datetime, Exclusion.end_datetime,
+                     exclusion_sensor_association.c.sensor_id).join(
+                        exclusion_sensor_association,
+                        onclause=(exclusion_sensor_association.c.exclusion_id == Exclusion.id)
+                        ).where(
+                    Exclusion.dataset_id == self.id).order_by(
+                    Exclusion.id, exclusion_sensor_association.c.sensor_id)
+        return tuple(session.execute(qry).all())
+
+    def get_rollup_sensors(self, sensors):
+        ''' Rollups ignore exclusions, so only sensors without any can use them. '''
+        excluded_sensor_ids = {row.sensor_id for row in self.get_exclusions_stamp()}
+        return [sensor for sensor in sensors if sensor.id not in excluded_sensor_ids]
+
+    def get_frame_source(self, sensors):
+        ''' The cache key and measurement query of the selected sensors. '''
         qry = self.make_meas_query(sensors)
-        qry_text = str(qry.compile(compile_kwargs={"literal_binds": True}))
-        res = session.execute(text(qry_text))
-        df = pd.DataFrame(res.fetchall(), columns=res.keys())
-        dtypes = {'datetime': 'datetime64[ns]', 'variable': str, 'value': 'float32'}
-        df = df.astype(dtypes)
-        return df
+        session = inspect(self).session
+        key = frame_cache.make_key(session.get_bind(), self.trial_id, 'dataset', get_sensors_stamp(sensors),
+                                   get_data_stamp(session, sensors),
+                                   self.start_datetime, self.end_datetime,
+                                   self.get_exclusions_stamp())
+        return key, qry
+
+    def get_dataframe(self, sensors=None):
+        session = inspect(self).session
+        key, qry = self.get_frame_source(sensors)
+        return frame_cache.cached_frame(key, lambda: read_frame(
+            session.connection(), qry, dtypes=MEASUREMENT_DTYPES))
+
+    def get_wide_frame(self, sensors=None):
+        ''' Readings of the selected sensors as a datetime by sensor label float32 frame. '''
+        labels = list(dict.fromkeys(get_sensor_label(sensor) for sensor in sensors))
+        return make_wide_frame(self.get_dataframe(sensors), labels)
 
     def row_count(self, sensors=None):
         session = inspect(self).session
@@ -401,45 +677,37 @@ class Dataset(Base):
         return inspect(self).session.execute(qry).all()
 
     def get_filtered_sensors(self, project, *pargs):
+        ''' Sensors passing every filter, as the intersection of one mask per filter. '''
         sensors = self.sensors
-        for filter_list in pargs:
-            for filter in filter_list:
-                if filter['filter_type'] == 'group_filter':
-                    key = filter['selected_key']
-                    value = filter['selected_value']
-                    session = inspect(self).session
-                    qry = select(Group).where(Group.project_id == project.id, Group.key == key, Group.value == value)
-                    group = session.execute(qry).scalar()
-                    if group is not None:
-                        keep_sensor_ids = group.get_sensor_ids(self)
-                    else:
-                        keep_sensor_ids = []
-                elif filter['filter_type'] == 'sensor_filter':
-                    key = filter['selected_key']
-                    value = filter['selected_value']
-                    keep_sensor_ids = [sensor.id for sensor in sensors if getattr(sensor, key) == value]
-                elif filter['filter_type'] == 'reference_filter':
-                    key = filter['selected_key']
-                    value = filter['selected_value']
-                    keep_sensor_ids = [sensor.id for sensor in sensors if getattr(sensor, key) != value]
-                sensors = [sensor for sensor in sensors if sensor.id in keep_sensor_ids]
-        return sensors
+        index = project.get_group_index()
+        keep = np.ones(len(sensors), dtype=bool)
+        for filter in chain.from_iterable(pargs):
+            keep &= get_filter_mask(filter, sensors, index, self.trial_id)
+        return [sensor for sensor, kept in zip(sensors, keep) if kept]
 
     def set_exclusions_df(self, selections):
-        commited_exclusions = self.get_exclusions_df()
-
-        # Prepare the dataframes
-        current_ids = commited_exclusions['id'].tolist()
-        existing_exclusions = selections[
-            selections['id'].isin(current_ids)]
-        new_exclusions = selections[
-            ~selections['id'].isin(current_ids)]        
-        deleted_exclusions = commited_exclusions[
-            ~commited_exclusions['id'].isin(selections['id'])]
+        ''' Saves the edited exclusions with bulk inserts, updates and deletes. '''
+        session = inspect(self).session
+        stored = self.get_exclusion_rows()
+        sensor_ids = self.get_sensor_ids_by_name()
+
+        # Prepare the rows
+        rows = selections.to_dict(orient='records')
+        existing_exclusions = [row for row in rows if not pd.isna(row['id']) and int(row['id']) in stored]
+        new_exclusions = [row for row in rows if pd.isna(row['id']) or int(row['id']) not in stored]
+        kept_ids = {int(row['id']) for row in existing_exclusions}
+        deleted_ids = [id for id in stored if id not in kept_ids]
+
+        self.update_exclusions(existing_exclusions, stored, sensor_ids)
+        self.add_new_exclusions(new_exclusions, sensor_ids)
+        self.remove_exclusions(deleted_ids)
+        # The bulk statements bypass any loaded exclusions, so reload them on next access
+        session.expire(self, ['exclusions'])
+        for item in list(session.identity_map.values()):
+            if isinstance(item, Exclusion):
+                session.expire(item)
+        frame_cache.evict_trial_on_commit(session, self.trial_id)
 
-        self.update_exclusions(existing_exclusions)
-        self.add_new_exclusions(new_exclusions)
-        self.remove_exclusions(deleted_exclusions)
 
 class Exclusion(Base):
     __tablename__ = 'exclusion'
@@ -451,19 +719,6 @@ class Exclusion(Base):
     sensors = relationship("Sensor", backref='exclusions', secondary=exclusion_sensor_association)
     dataset = relationship("Dataset", backref=backref("exclusions", cascade='all, delete-orphan'))
 
-    def check_update(self, row):
-        if self.start_datetime != row['start_datetime']:
-            self.start_datetime = row['start_datetime']
-        if self.end_datetime != row['end_datetime']:
-            self.end_datetime = row['end_datetime']
-
-        sensor_names = row['sensors']
-        existing_sensor_names = [sensor.get_display_name() for sensor in self.sensors]
-        if existing_sensor_names != sensor_names:
-            sensor_dict = {sensor.get_display_name(): sensor for sensor in self.dataset.sensors}
-            sensors = [sensor_dict[sensor_name] for sensor_name in row['sensors']]
-            self.sensors = sensors
-
 class Content(Base):
     __tablename__ = 'content'
     id = Column(Integer, Sequence('content_id_seq'),  primary_key=True)
@@ -543,8 +798,37 @@ class Metadata(Base):
 
 class Measurement(Base):
     __tablename__ = 'measurement'
+    sensor_id = Column(Integer, ForeignKey('sensor.id'))
     datetime = Column(TIMESTAMP)
-    variable = Column(String)
     value = Column(FLOAT)
-    trial = Column(Integer)
-    __table_args__ = (PrimaryKeyConstraint('datetime', 'variable', 'trial'),)
\ No newline at end of file
+    __table_args__ = (PrimaryKeyConstraint('sensor_id', 'datetime', name='pk_measurement'),)
+
+
+class MeasurementRollup(Base):
+    ''' Summaries of the measurements of a sensor per time bucket, see app.db.rollups. '''
+    __tablename__ = 'measurement_rollup'
+    sensor_id = Column(Integer, ForeignKey('sensor.id'))
+    resolution = Column(String)
+    bucket = Column(TIMESTAMP)
+    value_count = Column(Integer)
+    value_sum = Column(FLOAT)
+    value_min = Column(FLOAT)
+    value_max = Column(FLOAT)
+    value_sum_sq = Column(FLOAT)
+    __table_args__ = (PrimaryKeyConstraint('sensor_id', 'resolution', 'bucket', name='pk_measurement_rollup'),)
+
+
+def refresh_rollups(conn, sensor_ids, start_datetime, end_datetime):
+    ''' Rebuilds the rollups of the sensors for the whole days spanning the range
+        from the stored measurements, after measurements have changed. '''
+    lower, upper = rollups.get_day_range(start_datetime, end_datetime)
+    conn.execute(delete(MeasurementRollup).where(
+        MeasurementRollup.sensor_id.in_(sensor_ids),
+        MeasurementRollup.bucket >= lower,
+        MeasurementRollup.bucket < upper))
+    qry = select(Measurement.sensor_id, Measurement.datetime, Measurement.value).where(
+        Measurement.sensor_id.in_(sensor_ids),
+        Measurement.datetime >= lower,
+        Measurement.datetime < upper)
+    df = read_frame(conn, qry, dtypes={'datetime': 'datetime64[ns]'})
+    copy_dataframe(conn, MeasurementRollup.__table__, rollups.build_rollups(df))
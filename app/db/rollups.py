@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import pandas as pd
+
+''' Builds and combines per sensor rollups of the measurements. A rollup
+    row holds the count, sum, minimum, maximum and sum of squares of the
+    readings in one time bucket, so means, extremes and variances of any
+    coarser bucket can be computed from it without the raw readings. '''
+
+# Rollup resolutions stored in the database, finest first
+RESOLUTIONS = {'1min': '1min', '1h': '1h', '1d': '1D'}
+
+STAT_COLUMNS = ['value_count', 'value_sum', 'value_min', 'value_max', 'value_sum_sq']
+
+
+def floor_buckets(datetimes, freq, origin=None):
+    ''' Start of the bucket of freq each datetime falls in, counting buckets
+        from origin, or from the epoch when origin is None. '''
+    if origin is None:
+        return datetimes.dt.floor(freq)
+    width = pd.Timedelta(freq)
+    origin = pd.Timestamp(origin)
+    return origin + ((datetimes - origin) // width) * width
+
+def divides_day(freq):
+    ''' Whether buckets of freq tile a day, so counting from any midnight gives the same edges. '''
+    return pd.Timedelta('1D') % pd.Timedelta(freq) == pd.Timedelta(0)
+
+def summarise(df, keys, freq, origin=None):
+    ''' Reduces readings (keys, datetime, value) to summaries per key and bucket. '''
+    value = df['value'].astype('float64')
+    df = pd.DataFrame({**{key: df[key] for key in keys},
+                       'datetime': floor_buckets(df['datetime'], freq, origin),
+                       'value': value,
+                       'value_sq': value ** 2})
+    grouped = df.groupby(keys + ['datetime'], sort=False, observed=True)
+    return grouped.agg(value_count=('value', 'count'),
+                       value_sum=('value', 'sum'),
+                       value_min=('value', 'min'),
+                       value_max=('value', 'max'),
+                       value_sum_sq=('value_sq', 'sum')).reset_index()
+
+def merge_summaries(df, keys, freq, origin=None):
+    ''' Combines summaries into buckets of freq, which must be a multiple of theirs. '''
+    df = df.assign(datetime=floor_buckets(df['datetime'], freq, origin))
+    grouped = df.groupby(keys + ['datetime'], sort=False, observed=True)
+    return grouped.agg(value_count=('value_count', 'sum'),
+                       value_sum=('value_sum', 'sum'),
+                       value_min=('value_min', 'min'),
+                       value_max=('value_max', 'max'),
+                       value_sum_sq=('value_sum_sq', 'sum')).reset_index()
+
+def build_rollups(df):
+    ''' Every stored resolution for readings (sensor_id, datetime, value),
+        each resolution built from the one below it. '''
+    df = df[['sensor_id', 'datetime', 'value']].dropna()
+    if getattr(df['datetime'].dtype, 'tz', None) is not None:
+        df = df.assign(datetime=df['datetime'].dt.tz_convert('UTC').dt.tz_localize(None))
+    frames = []
+    summary = None
+    for resolution, freq in RESOLUTIONS.items():
+        if summary is None:
+            summary = summarise(df, ['sensor_id'], freq)
+        else:
+            summary = merge_summaries(summary, ['sensor_id'], freq)
+        frames.append(summary.assign(resolution=resolution))
+    df = pd.concat(frames, ignore_index=True).rename(columns={'datetime': 'bucket'})
+    return df[['sensor_id', 'resolution', 'bucket'] + STAT_COLUMNS]
+
+def choose_resolution(freq):
+    ''' The coarsest stored resolution whose buckets tile buckets of freq. '''
+    width = pd.Timedelta(freq)
+    for resolution in reversed(RESOLUTIONS):
+        if width % pd.Timedelta(RESOLUTIONS[resolution]) == pd.Timedelta(0):
+            return resolution
+    return None
+
+def choose_display_freq(start_datetime, end_datetime, point_budget):
+    ''' The finest stored resolution that keeps a series of the range within
+        the point budget, or None if minute data would already fit. '''
+    span = pd.Timestamp(end_datetime) - pd.Timestamp(start_datetime)
+    for resolution, freq in RESOLUTIONS.items():
+        if span / pd.Timedelta(freq) <= point_budget:
+            return None if resolution == '1min' else freq
+    return RESOLUTIONS['1d']
+
+def get_full_range(start_datetime, end_datetime, resolution):
+    ''' The part of the range covered by whole buckets of the resolution. '''
+    width = pd.Timedelta(RESOLUTIONS[resolution])
+    full_start = pd.Timestamp(start_datetime).ceil(width)
+    full_end = pd.Timestamp(end_datetime).floor(width)
+    return full_start.to_pydatetime(), full_end.to_pydatetime()
+
+def get_day_range(start_datetime, end_datetime):
+    ''' Whole days spanning the range, the unit rollups are refreshed in. '''
+    lower = pd.Timestamp(start_datetime).floor('1D')
+    upper = pd.Timestamp(end_datetime).floor('1D') + pd.Timedelta('1D')
+    return lower.to_pydatetime(), upper.to_pydatetime()
@@ -14,3 +14,12 @@ port = st.secrets["DB_PORT"]
 dialect = st.secrets["DB_DIALECT"]
 db_name = st.secrets["DB_NAME"]
 DATABASE_URL = f"{dialect}://{user}:{password}@{host}:{port}/{db_name}"
+
+# Connection pool shared by every user of the app
+POOL_SIZE = int(st.secrets.get("DB_POOL_SIZE", 5))
+MAX_OVERFLOW = int(st.secrets.get("DB_MAX_OVERFLOW", 10))
+POOL_TIMEOUT = int(st.secrets.get("DB_POOL_TIMEOUT", 30))
+POOL_RECYCLE = int(st.secrets.get("DB_POOL_RECYCLE", 1800))
+
+# Worker processes a batch file import may start on the server
+IMPORT_WORKERS = int(st.secrets.get("IMPORT_WORKERS", 2))
@@ -10,9 +10,17 @@ from sqlalchemy.orm import Session
 
 @event.listens_for(Session, 'before_attach')
 def receive_before_attach(session, instance):
-    if instance.__class__.__name__ == 'Trial':
+    # Trials re-attached from an earlier session have no readings map to apply
+    if instance.__class__.__name__ == 'Trial' and instance.readings_map is not None:
         instance.apply_readings_map()
 
+@event.listens_for(Session, "after_flush")
+def insert_trial_readings(session, flush_context):
+    # New trials still appear in session.new here, after their sensors are inserted
+    for obj in session.new:
+        if obj.__class__.__name__ == 'Trial' and obj.dataframe is not None:
+            obj.insert_dataframe(session.connection())
+
 @event.listens_for(Session, "before_flush")
 def enforce_non_empty_groups(session, flush_context, instances):
     for obj in session.new.union(session.dirty):
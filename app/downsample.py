@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import numpy as np
+import pandas as pd
+
+''' Reduces time series to a point budget before they are plotted.
+    Each series of a long format dataframe is reduced on its own with
+    either largest-triangle-three-buckets (keeps the visual shape of a
+    line) or min/max per bucket (keeps every peak and trough). '''
+
+# Roughly two points per horizontal pixel of a wide chart
+POINT_BUDGET = 2000
+
+
+def as_float(values):
+    ''' Numeric view of an x axis column, datetimes as nanoseconds. '''
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        return values.view('int64').astype('float64')
+    if values.dtype.kind in 'iuf':
+        return values.astype('float64')
+    return pd.to_datetime(values).to_numpy().view('int64').astype('float64')
+
+def lttb_indices(x, y, n_out):
+    ''' Positions of the points kept by largest-triangle-three-buckets. '''
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    # First and last points are always kept, the rest split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_stop = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_stop = n - 1, n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+        # Twice the area of the triangle formed with the previous point and the next average
+        area = np.abs((x[a] - avg_x) * (y[start:stop] - y[a]) -
+                      (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+def minmax_indices(y, n_out):
+    ''' Positions of the minimum and maximum of each of n_out / 2 buckets. '''
+    n = len(y)
+    if n <= n_out or n_out < 2:
+        return np.arange(n)
+    size = -(-n // (n_out // 2))
+    n_buckets = -(-n // size)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    keep = np.concatenate([offsets + np.nanargmin(padded, axis=1),
+                           offsets + np.nanargmax(padded, axis=1),
+                           [0, n - 1]])
+    return np.unique(keep)
+
+def downsample(df, x, y, by=None, n_out=POINT_BUDGET, method='lttb'):
+    ''' Reduces every series of the long format dataframe to at most
+        n_out points. Rows must already be in x order within a series. '''
+    if len(df) <= n_out:
+        return df
+    df = df[df[y].notna()]
+    if by is None:
+        groups = {None: np.arange(len(df))}
+    else:
+        groups = df.groupby(by, sort=False, observed=True).indices
+    x_values = as_float(df[x].to_numpy())
+    y_values = df[y].to_numpy(dtype='float64')
+    positions = []
+    for indices in groups.values():
+        if method == 'minmax':
+            keep = minmax_indices(y_values[indices], n_out)
+        else:
+            keep = lttb_indices(x_values[indices], y_values[indices], n_out)
+        positions.append(indices[keep])
+    return df.iloc[np.sort(np.concatenate(positions))]
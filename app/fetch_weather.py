@@ -4,20 +4,20 @@ Created on Tue Jan 28 11:52:02 2025
 @author: Phoebe.Sinclair
 """
 
-import requests_cache
-import openmeteo_requests 
 import pandas as pd
+import app.weather_store as weather_store
 
-''' Fetches weather data from the Open Meteo API and caches the responses.
-    The data is returned as a pandas DataFrame.'''
+''' Fetches weather data from the Open Meteo archive API. Readings are
+    kept in the local weather store, so only dates that have not been
+    downloaded for the site before are requested. The data is returned as
+    a pandas DataFrame.'''
 
-# Create a cache session to store the responses for Open Meteo API calls
-cache_session = requests_cache.CachedSession('cache/openmeteo_cache', expire_after=3600)
 
-def fetch_weather_data(latitude, longitude, start_date, end_date):
-    # Initialize the weather client with the cache session
-    openmeteo = openmeteo_requests.Client(session=cache_session)
-    
+def fetch_archive(latitude, longitude, start_date, end_date):
+    ''' Hourly UTC readings from the Open Meteo archive API. '''
+    import openmeteo_requests
+    openmeteo = openmeteo_requests.Client()
+
     url = "https://archive-api.open-meteo.com/v1/archive"
     params = {
         "latitude": latitude,
@@ -31,10 +31,10 @@ def fetch_weather_data(latitude, longitude, start_date, end_date):
     responses = openmeteo.weather_api(url, params=params)
     response = responses[0]
     hourly = response.Hourly()
-    
+
     start_datetime = pd.to_datetime(hourly.Time(), unit="s", utc=True)
     end_datetime = pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True)
-    
+
     # Return the weather data as a pandas DataFrame
     return pd.DataFrame({
         "datetime": pd.to_datetime(pd.date_range(
@@ -49,4 +49,9 @@ def fetch_weather_data(latitude, longitude, start_date, end_date):
         "shortwave_radiation": hourly.Variables(3).ValuesAsNumpy(),
         "sunshine_duration": hourly.Variables(4).ValuesAsNumpy(),
         "weather_code": hourly.Variables(5).ValuesAsNumpy()
-    })
\ No newline at end of file
+    })
+
+def fetch_weather_data(latitude, longitude, start_date, end_date, fetch=fetch_archive):
+    ''' Hourly weather of the site between the dates. Pass a different fetch
+        with the same signature as fetch_archive to read from elsewhere. '''
+    return weather_store.get_weather(latitude, longitude, start_date, end_date, fetch)
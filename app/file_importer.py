@@ -3,9 +3,81 @@
 @author: Graham.Macleod
 """
 
+import numpy as np
 import pandas as pd
+from datetime import datetime, time
 
 ''' Provides classes for reading files. '''
+
+# Value stored for an empty Excel cell, by the kind of its column array
+MISSING_CELLS = {'f': np.nan, 'M': np.datetime64('NaT'), 'O': np.nan}
+
+
+def get_cell_dtype(value):
+    ''' Array type for a column of streamed cells starting with the value.
+        Empty cells start a numeric column, the commonest logger column. '''
+    if value is None or isinstance(value, (int, float)) and not isinstance(value, bool):
+        return np.float64
+    if isinstance(value, datetime):
+        return 'datetime64[ns]'
+    return object
+
+def cell_fits(kind, value):
+    ''' Whether the cell value can be stored in an array of the given kind. '''
+    if kind == 'f':
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if kind == 'M':
+        return isinstance(value, datetime)
+    return True
+
+def store_cell(arrays, column, position, value):
+    ''' Stores a cell in its column array, widening the column to
+        objects when the value does not fit its type. '''
+    array = arrays[column]
+    if value is None:
+        value = MISSING_CELLS[array.dtype.kind]
+    elif not cell_fits(array.dtype.kind, value):
+        array = arrays[column] = array.astype(object)
+    array[position] = value
+
+def parse_datetimes(col, dt_formats):
+    ''' Parses the column with the first candidate format that fits every entry. '''
+    if not dt_formats:
+        return pd.to_datetime(col)
+    for dt_format in dt_formats[:-1]:
+        try:
+            return pd.to_datetime(col, format=dt_format)
+        except ValueError:
+            pass
+    return pd.to_datetime(col, format=dt_formats[-1])
+
+def parse_times(col, t_formats):
+    ''' Time of day entries as timedeltas since midnight. '''
+    entries = col.dropna()
+    if col.dtype.kind == 'O' and len(entries) > 0 and isinstance(entries.iloc[0], time):
+        # Time cells read from Excel are already clock times
+        return pd.to_timedelta(col.astype(str))
+    if col.dtype.kind != 'M':
+        col = parse_datetimes(col.astype(str), t_formats)
+    return col - col.dt.floor('1D')
+
+def insert_datetime_column(df, dt_col_indexes, formats):
+    ''' Replaces the datetime column, or the date and time columns, with a
+        leading parsed datetime column. '''
+    if len(dt_col_indexes) == 1:
+        dt_col, = dt_col_indexes
+        dt_formats, = formats
+        datetime_col = parse_datetimes(df.iloc[:, dt_col], dt_formats)
+    else:
+        d_col, t_col = dt_col_indexes
+        d_formats, t_formats = formats
+        # Days plus times of day, without building and reparsing datetime strings
+        dates = parse_datetimes(df.iloc[:, d_col], d_formats).dt.floor('1D')
+        datetime_col = dates + parse_times(df.iloc[:, t_col], t_formats)
+    df = df.rename(columns={"datetime": "datetime_old"})
+    df.insert(0, 'datetime', datetime_col)
+    return df.drop(columns=df.columns[[index + 1 for index in dt_col_indexes]])
+
 class CSVReaderBehaviours:
 
     def read_file(file, **kwargs):
@@ -15,8 +87,14 @@ class CSVReaderBehaviours:
         except:
             return pd.DataFrame({})
 
+    def read_chunks(file, chunksize, **kwargs):
+        ''' Yields consecutive chunks of the file in a single forward pass. '''
+        file.seek(0)
+        with pd.read_csv(file, chunksize=chunksize, **kwargs) as reader:
+            yield from reader
+
     def get_buffer_size(file_path):
-        return 1000
+        return 100000
 
 class ExcelReaderBehaviours:
 
@@ -27,18 +105,58 @@ class ExcelReaderBehaviours:
         except:
             return pd.DataFrame({})
 
-    def get_buffer_size(file_path):
-        ''' Uses openpyxl to get the number of rows in the excel file. 
-            Uses the number of rows to make a guess a suitable buffer size.'''
+    def read_chunks(file, chunksize, skiprows=0, usecols=None, sheet_name=0, **kwargs):
+        ''' Yields consecutive chunks of the sheet in a single forward pass
+            over its rows, the first row read being the header. '''
         from openpyxl import load_workbook
-        workbook = load_workbook(file_path, read_only=True)
-        sheet = workbook.active
-        row_count = sheet.max_row
-        if row_count >= 20000:
-            return 10000
-        if row_count >= 2000:
-            return 1000
-        return row_count
+        from openpyxl.utils.exceptions import InvalidFileException
+        from zipfile import BadZipFile
+        file.seek(0)
+        try:
+            workbook = load_workbook(file, read_only=True, data_only=True)
+        except (InvalidFileException, BadZipFile):
+            # Legacy .xls workbooks cannot be streamed by openpyxl, which
+            # rejects them by name or, for file objects, as a bad zip file
+            file.seek(0)
+            yield pd.read_excel(file, skiprows=skiprows, usecols=usecols, sheet_name=sheet_name, **kwargs)
+            return
+        try:
+            if isinstance(sheet_name, int):
+                sheet = workbook.worksheets[sheet_name]
+            else:
+                sheet = workbook[sheet_name]
+            rows = sheet.iter_rows(min_row=skiprows + 1, values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            if usecols is None:
+                usecols = range(len(header))
+            columns = [f'Unnamed: {i}' if header[i] is None else header[i] for i in usecols]
+            dtypes = None
+            arrays = None
+            count = 0
+            for row in rows:
+                if dtypes is None:
+                    dtypes = [get_cell_dtype(row[i] if i < len(row) else None) for i in usecols]
+                if arrays is None:
+                    arrays = [np.empty(chunksize, dtype=dtype) for dtype in dtypes]
+                for column, i in enumerate(usecols):
+                    store_cell(arrays, column, count, row[i] if i < len(row) else None)
+                count += 1
+                if count == chunksize:
+                    yield pd.DataFrame(dict(zip(columns, arrays)))
+                    # Columns widened in this chunk start the next one widened
+                    dtypes = [array.dtype for array in arrays]
+                    arrays = None
+                    count = 0
+            if count > 0:
+                yield pd.DataFrame({name: array[:count] for name, array in zip(columns, arrays)})
+        finally:
+            workbook.close()
+
+    def get_buffer_size(file_path):
+        ''' Rows streamed from the workbook per chunk. '''
+        return 10000
 
     def get_sheet_names(self):
         from openpyxl import load_workbook
@@ -53,58 +171,33 @@ class FileReaderBehaviours:
     def read_display_preview(self, *pargs, **kwargs):
         return self.filetype_behaviour.read_file(*pargs, nrows=10, dtype=str, **kwargs)
 
-    def read_preview_with_datetime_column(self, file, dt_col, **kwargs):
+    def read_preview_with_datetime_column(self, file, dt_col, formats=((), ), **kwargs):
         df = self.read_detection_preview(file, **kwargs)
-        df.rename(columns={"datetime": "datetime_old"}, inplace=True)
-        df.insert(0, 'datetime', pd.to_datetime(df.iloc[:, dt_col]))
-        return df.drop(columns=df.columns[dt_col + 1])
+        return insert_datetime_column(df, (dt_col, ), formats)
 
-    def read_preview_with_date_and_time_column(self, file, d_col, t_col, **kwargs):
+    def read_preview_with_date_and_time_column(self, file, d_col, t_col, formats=((), ()), **kwargs):
         df = self.read_detection_preview(file, **kwargs)
-        df.rename(columns={"datetime": "datetime_old"}, inplace=True)
-        df.insert(0, 'datetime', pd.to_datetime(
-            pd.to_datetime(df.iloc[:, d_col]).dt.date.astype(str) + 
-            ' ' + df.iloc[:, t_col].astype(str)))
-        return df.drop(columns=df.columns[[d_col + 1, t_col + 1]])
+        return insert_datetime_column(df, (d_col, t_col), formats)
 
-    def read_full(self, file, *dt_col_indexes, **kwargs):
+    def read_full(self, file, *dt_col_indexes, formats=None, **kwargs):
+        ''' Reads the whole file, parsing the datetime columns with the
+            formats detected in the preview so no entry is parsed alone. '''
         df = self.buffered_read_until_empty_row(file, **kwargs)
-        if len(dt_col_indexes) == 1:
-            dt_col = dt_col_indexes[0]
-            df.rename(columns={"datetime": "datetime_old"}, inplace=True)
-            df.insert(0, 'datetime', pd.to_datetime(df.iloc[:, dt_col]))
-            df = df.drop(columns=df.columns[[dt_col + 1]])
-        else:
-            d_col, t_col = dt_col_indexes
-            datetime_col = pd.to_datetime(
-                           pd.to_datetime(df.iloc[:, d_col]).dt.date.astype(str) +
-                           ' ' + df.iloc[:, t_col].astype(str))
-            df.rename(columns={"datetime": "datetime_old"}, inplace=True)
-            df.insert(0, 'datetime', datetime_col)
-            return df.drop(columns=df.columns[[d_col + 1, t_col +1]])
-        return df
-
-    def buffered_read_until_empty_row(self, file, skiprows=0, buffer_size=None, **kwargs):
-        ''' Reads a file in chunks until an empty row is found. '''
+        if formats is None:
+            formats = ((), ) * len(dt_col_indexes)
+        return insert_datetime_column(df, dt_col_indexes, formats)
+
+    def buffered_read_until_empty_row(self, file, buffer_size=None, **kwargs):
+        ''' Reads a file forward in chunks until an empty row is found. '''
         if buffer_size is None:
             buffer_size = self.filetype_behaviour.get_buffer_size(file)
-        start_skipsrows = skiprows
-        df = None
-        while True:
-            if df is None:
-                df = self.filetype_behaviour.read_file(file, skiprows=skiprows, nrows=buffer_size, **kwargs)
-                headers = df.columns
-            else:
-                df_next = self.filetype_behaviour.read_file(file, skiprows=skiprows, nrows=buffer_size, header=None, **kwargs)
-                if df_next.empty:
-                    return df.reset_index().drop(columns=['index'])
-                df_next.columns = headers
-                for index, row in df_next.iterrows():
-                    if row.isnull().all():
-                        return pd.concat([df, df_next.iloc[:index]], axis=0).reset_index().drop(columns=['index'])
-                df = pd.concat([df, df_next], axis=0)
-            # The first loop needs to skip an extra row to account for headers
-            if skiprows == start_skipsrows:
-                skiprows += buffer_size + 1
-            else:
-                skiprows += buffer_size
+        chunks = []
+        for chunk in self.filetype_behaviour.read_chunks(file, buffer_size, **kwargs):
+            empty_rows = np.flatnonzero(chunk.isna().all(axis=1).to_numpy())
+            if len(empty_rows) > 0:
+                chunks.append(chunk.iloc[:empty_rows[0]])
+                break
+            chunks.append(chunk)
+        if not chunks:
+            return pd.DataFrame({})
+        return pd.concat(chunks, ignore_index=True)
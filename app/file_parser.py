@@ -5,52 +5,86 @@
 
 import pandas as pd
 import warnings
-from dateutil import parser
+from pandas.tseries.api import guess_datetime_format
 
 ''' Detects the type of each column in a dataframe.
     Returns a generator that yields the type of each column. The types can be:
     - 'datetime': if the column is a datetime column
     - 'date': if the column is a date column
     - 'time': if the column is a time column
-    - 'float': if the column is a float column 
+    - 'float': if the column is a float column
+    Datetime, date and time columns are detected by guessing strftime
+    formats from the first entry and checking the whole column parses with
+    them, so the same formats can be given to the full file read.
 '''
 
+# pandas cannot guess formats without a date, so time columns are tried against these
+TIME_FORMATS = ['%H:%M:%S', '%H:%M', '%H:%M:%S.%f', '%I:%M:%S %p', '%I:%M %p']
 
-def detect_types(df):
-    ''' For a given dataframe, detect datetime, date and time columns.'''
-    df = df.astype(str)
-    # Temporarily catch warnings within this block
+# Text of the missing entries once the preview is converted to strings
+EMPTY_ENTRIES = ['', 'nan', 'NaN', 'None', 'NaT']
+
+DATE_DIRECTIVES = ['%d', '%m', '%y', '%Y', '%b', '%B', '%j']
+TIME_DIRECTIVES = ['%H', '%I', '%M', '%S']
+
+
+def is_year_day_month(dt_format):
+    positions = [min((dt_format.find(d) for d in directives if d in dt_format), default=-1)
+                 for directives in (('%Y', '%y'), ('%d',), ('%m',))]
+    return -1 not in positions and positions[0] < positions[1] < positions[2]
+
+def gen_candidate_formats(entry):
+    ''' Formats the entry could be written in, the most likely first. Month
+        first is tried first for ambiguous dates, as pandas reads them. '''
     with warnings.catch_warnings():
-        warnings.simplefilter("error", UserWarning)
-        # Loop through each column and try to convert it to datetime
-        for i in range(len(df.columns)):
-            try:
-                col = pd.to_datetime(df.iloc[:, i])
+        # Guessing a day first format without dayfirst=True warns
+        warnings.simplefilter("ignore", UserWarning)
+        guesses = [guess_datetime_format(entry), guess_datetime_format(entry, dayfirst=True)]
+    for dt_format in dict.fromkeys(guesses + TIME_FORMATS):
+        # Year, day, month orders are not written in practice
+        if dt_format is not None and not is_year_day_month(dt_format):
+            yield dt_format
+
+def get_format_type(dt_format):
+    ''' Whether a format writes a datetime, a date or a time. '''
+    has_date = any(directive in dt_format for directive in DATE_DIRECTIVES)
+    has_time = any(directive in dt_format for directive in TIME_DIRECTIVES)
+    if has_date and has_time:
+        return 'datetime'
+    return 'date' if has_date else 'time'
+
+def detect_column(col):
+    ''' The type of a column of strings and every format its datetimes could be
+        written in. A short preview can leave the day and month order open. '''
+    entries = col.str.strip()
+    present = entries[~entries.isin(EMPTY_ENTRIES)]
+    if present.empty:
+        return None, ()
+    if pd.to_numeric(present, errors='coerce').notna().all():
+        return 'float', ()
+    # Columns must start with an entry so that the user makes sure the data starts with a datetime
+    if entries.iloc[0] in EMPTY_ENTRIES:
+        return None, ()
+    column_type = None
+    dt_formats = []
+    for dt_format in gen_candidate_formats(entries.iloc[0]):
+        parsed = pd.to_datetime(present, format=dt_format, errors='coerce')
+        if parsed.notna().all():
+            if column_type is None:
+                column_type = get_format_type(dt_format)
                 # If all entries are just the date component of the datetime, must be date column
-                if (all(col.dt.date == col)):
-                    yield 'date'
-                # If the reader receives just empty strings, it will assume it could be a datetime column
-                # but it could be that the first few entries are empty and the rest are not dates.
-                # We'll reject any columns with the first entry being an empty so the user must
-                # make sure that the data starts with a non-null datetime.
-                elif pd.isnull(col.iloc[0]):
-                    yield None
-                elif col.dtype == 'datetime64[ns]':
-                    yield 'datetime'
-            except (ValueError, UserWarning, pd._libs.tslibs.parsing.DateParseError):
-                # If datetime or date not detected, try to parse the column as time
-                col = df.iloc[:, i]
-                # Make sure that the column does not have floats first
-                try:
-                    col.astype('float')
-                    yield 'float'
-                except ValueError:
-                    try:
-                        col = col.apply(lambda x: parser.parse(x).time())
-                    except (TypeError, parser._parser.ParserError):
-                        yield None
-                    else:
-                        if pd.isnull(col.iloc[0]):
-                            yield None
-                        else:
-                            yield 'time'
+                if column_type == 'datetime' and (parsed == parsed.dt.normalize()).all():
+                    column_type = 'date'
+            dt_formats.append(dt_format)
+    return column_type, tuple(dt_formats)
+
+def detect_columns(df):
+    ''' For a given dataframe, detect the type and datetime formats of each column. '''
+    df = df.astype(str)
+    for i in range(len(df.columns)):
+        yield detect_column(df.iloc[:, i])
+
+def detect_types(df):
+    ''' For a given dataframe, detect datetime, date and time columns.'''
+    for column_type, _ in detect_columns(df):
+        yield column_type
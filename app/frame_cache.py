@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import os
+import glob
+import time
+import hashlib
+import threading
+import pandas as pd
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+''' Provides an on-disk Parquet cache for measurement dataframes.
+    Entries are named by database, trial id and a digest of everything that
+    can change the result (sensors and their display names, reading count,
+    time range, exclusions), so an edit produces a new key rather than a
+    stale read, even when another process made it.
+    Entries for a trial are also evicted once a session that saved its
+    exclusions, sensor names or readings commits. Reads refresh the
+    modification time of an entry, and after every write the entries unused
+    for longest are removed until the cache is under its age and size limits. '''
+
+CACHE_DIR = os.path.join('cache', 'frames')
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+MAX_CACHE_AGE = 7 * 24 * 60 * 60 # seconds
+
+# Session.info key of the trials to evict when the session commits
+PENDING_KEY = 'frame_cache_trials'
+
+
+def get_database_id(bind):
+    ''' Short digest of the database URL of an engine or connection. '''
+    url = bind.engine.url.render_as_string(hide_password=True)
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+
+def make_key(bind, trial_id, *parts):
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return f"{get_database_id(bind)}_{trial_id}_{digest}"
+
+def get_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+def load_frame(key):
+    path = get_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_parquet(path)
+        os.utime(path)
+        return df
+    except (ImportError, OSError, ValueError):
+        return None
+
+def store_frame(key, df):
+    ''' Writes to a temporary file first so readers never see a partial file. '''
+    path = get_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except (ImportError, OSError, ValueError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    prune()
+
+def cached_frame(key, read):
+    ''' Returns the cached dataframe for the key, calling read() on a miss. '''
+    df = load_frame(key)
+    if df is None:
+        df = read()
+        store_frame(key, df)
+    return df
+
+def prune(max_bytes=MAX_CACHE_BYTES, max_age=MAX_CACHE_AGE):
+    ''' Removes expired entries, then the least recently used until under max_bytes. '''
+    entries = []
+    for path in glob.glob(os.path.join(CACHE_DIR, "*.parquet")):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    expired = time.time() - max_age
+    for mtime, size, path in entries:
+        if mtime >= expired and total <= max_bytes:
+            break
+        remove(path)
+        total -= size
+
+def remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def evict_trial(bind, trial_id):
+    for path in glob.glob(os.path.join(CACHE_DIR, f"{get_database_id(bind)}_{trial_id}_*.parquet")):
+        remove(path)
+
+def evict_trial_on_commit(session, trial_id):
+    ''' Evicts the trial's entries once the session commits. Evicting earlier
+        would let a reader store the committed readings again in the meantime. '''
+    session.info.setdefault(PENDING_KEY, set()).add(trial_id)
+
+@event.listens_for(Session, "after_commit")
+def evict_on_commit(session):
+    trial_ids = session.info.pop(PENDING_KEY, ())
+    if trial_ids:
+        bind = session.get_bind()
+        for trial_id in trial_ids:
+            evict_trial(bind, trial_id)
+
+@event.listens_for(Session, "after_rollback")
+def discard_on_rollback(session):
+    # Nothing the session changed reached the database
+    session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+''' Finds the latitude and longitude of a postcode. Geocoders are tried
+    in turn: an offline gazetteer of postcode centroids read from a local
+    CSV file, then the Nominatim web service. Coordinates that are found
+    are remembered for the life of the process, while failures are retried,
+    as the web service may only be down for a while. '''
+
+# CSV with postcode, latitude and longitude columns, such as an export of Code-Point Open
+GAZETTEER_PATH = os.path.join('data', 'postcode_centroids.csv')
+
+
+def normalise_postcode(postcode):
+    return ''.join(str(postcode).split()).upper()
+
+
+class GazetteerGeocoder:
+
+    def __init__(self, path=GAZETTEER_PATH):
+        self.path = path
+        self.postcodes = None
+
+    def load(self):
+        ''' Reads the file once into arrays sorted by postcode, empty if it is missing. '''
+        if self.postcodes is not None:
+            return
+        try:
+            df = pd.read_csv(self.path, usecols=['postcode', 'latitude', 'longitude'], dtype={'postcode': str})
+        except (OSError, ValueError):
+            df = pd.DataFrame({'postcode': [], 'latitude': [], 'longitude': []})
+        df = df.dropna().assign(postcode=lambda df: df['postcode'].map(normalise_postcode))
+        df = df.sort_values('postcode', kind='stable').drop_duplicates('postcode')
+        self.postcodes = df['postcode'].to_numpy(dtype=str)
+        self.latitudes = df['latitude'].to_numpy(dtype=float)
+        self.longitudes = df['longitude'].to_numpy(dtype=float)
+
+    def geocode(self, postcode):
+        self.load()
+        postcode = normalise_postcode(postcode)
+        i = np.searchsorted(self.postcodes, postcode)
+        if i < len(self.postcodes) and self.postcodes[i] == postcode:
+            return float(self.latitudes[i]), float(self.longitudes[i])
+        return None, None
+
+
+class NominatimGeocoder:
+
+    def __init__(self, user_agent="streamlit-geocoder"):
+        self.user_agent = user_agent
+
+    def geocode(self, postcode):
+        from geopy.geocoders import Nominatim
+        from geopy.exc import GeocoderServiceError
+        geolocator = Nominatim(user_agent=self.user_agent)
+        try:
+            location = geolocator.geocode(postcode)
+            if location:
+                return location.latitude, location.longitude
+        except GeocoderServiceError:
+            pass
+        return None, None
+
+
+GEOCODERS = [GazetteerGeocoder(), NominatimGeocoder()]
+
+found = {}
+
+
+def get_coordinates(postcode, geocoders=None):
+    ''' Latitude and longitude of the postcode from the first geocoder that
+        knows it, or None, None. '''
+    if postcode is None or normalise_postcode(postcode) == '':
+        return None, None
+    key = normalise_postcode(postcode)
+    if geocoders is None and key in found:
+        return found[key]
+    for geocoder in GEOCODERS if geocoders is None else geocoders:
+        latitude, longitude = geocoder.geocode(postcode)
+        if latitude is not None and longitude is not None:
+            if geocoders is None:
+                found[key] = (latitude, longitude)
+            return latitude, longitude
+    return None, None
@@ -5,8 +5,6 @@ Created on Tue Jan 28 11:52:02 2025
 """
 
 import pandas as pd
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
 import openmeteo_requests
 import requests_cache
 from retry_requests import retry
@@ -17,18 +15,6 @@ cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
 retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
 openmeteo = openmeteo_requests.Client(session=retry_session)
 
-# Function to get coordinates from postcode 
-def get_coordinates(postcode):
-    geolocator = Nominatim(user_agent="streamlit-geocoder")
-    try:
-        location = geolocator.geocode(postcode)
-        if location:
-            return location.latitude, location.longitude
-        else:
-            return None, None
-    except GeocoderTimedOut:
-        return None, None
-
 # Function to fetch weather data from Open-Meteo API
 def fetch_weather_data(latitude, longitude):
     url = "https://api.open-meteo.com/v1/forecast"
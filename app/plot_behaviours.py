@@ -5,6 +5,9 @@
 
 import numpy as np
 import pandas as pd
+from app.downsample import downsample
+from app.wide_frame import melt_wide_frame, get_sensor_label
+import app.preprocess_engine as engine
 
 ''' Provides classes for visualisation of data. This is the main
     class for the visualisation. It handles the data processing
@@ -49,16 +52,11 @@ class GroupYPlot:
 
 class DLIPreprocess:
     def process(self):
-        df = self.dataset.get_dataframe(self.sensors)
-        df_dli = df.copy()
-        df_dli = df_dli.pivot(index='datetime', columns='variable', values='value')
-        df_dli = df_dli.reset_index()
-        df_dli['day'] = df_dli['datetime'].dt.date
-        df_dli.drop('datetime', axis=1, inplace=True)
-        sensors = [column for column in df_dli.columns if column != 'day']
-        df_dli = df_dli[['day'] + sensors].groupby('day').sum().reset_index()
-        df_dli[sensors] = 60 * df_dli[sensors] / 1000000
-        df_dli = df_dli.melt(id_vars='day', var_name='variable', value_name='value').reset_index()
+        # Daily sums are read from the daily rollups where the dataset allows it
+        df = self.dataset.get_aggregates(self.sensors, '1D')
+        df_dli = pd.DataFrame({'day': df['datetime'].dt.date,
+                               'variable': df['variable'],
+                               'value': 60 * df['value_sum'] / 1000000})
         return 'day', 'value', df_dli
 
     def display_text(self):
@@ -68,17 +66,11 @@ class DLIPreprocess:
 
 class TransmissibilityPreprocess:
     def process(self):
-        sensors = self.sensors + [self.reference_sensor]
-        df = self.dataset.get_dataframe(sensors)
-        df = df.pivot(index='datetime', columns='variable', values='value')
-        for sensor in self.sensors:
-            df[sensor.name] = df[sensor.name] / df[self.reference_sensor.name]
-        df = df.drop(self.reference_sensor.name, axis=1)
-        df = df.reset_index()
-        df = df.melt(id_vars='datetime', var_name='variable', value_name='value')
-        df.replace([np.inf, -np.inf], np.nan, inplace=True)
-        df.dropna(inplace=True)
-        df.reset_index(inplace=True)
+        reference = get_sensor_label(self.reference_sensor)
+        wide = self.dataset.get_wide_frame(self.sensors + [self.reference_sensor])
+        sensors = wide.columns.drop(reference)
+        ratios = engine.get_ratios(wide[sensors].to_numpy(), wide[reference].to_numpy())
+        df = melt_wide_frame(pd.DataFrame(ratios, index=wide.index, columns=sensors))
         return self.x_axis, self.y_axis, df
         
     def display_text(self):
@@ -86,26 +78,17 @@ class TransmissibilityPreprocess:
 
 class DetrendPreprocess:
     def process(self):
-        df = self.dataset.get_dataframe(self.sensors).reset_index()
-        df = df.pivot(index='datetime', columns='variable', values='value')
+        wide = self.dataset.get_wide_frame(self.sensors)
+        times, values = wide.index.to_numpy(), wide.to_numpy()
         # Downsample only
         interval_in_seconds = self.quantity * {'s': 1, 'min': 60, 'h': 3600}[self.detrend_units]
-        time_in_seconds = df.reset_index()['datetime'].astype('int64') // 10**9
-        mean_time_interval = time_in_seconds.diff().mean() * 1000
+        mean_time_interval = engine.get_mean_interval(times) * 1000
         if mean_time_interval < interval_in_seconds:
             new_time_interval = f"{self.quantity}{self.detrend_units}"
-            df = df.copy().reset_index().resample(new_time_interval, on='datetime').mean()
-        df_mean = df.reset_index()
-        # Original data
-        sensor_names = [sensor.name for sensor in self.sensors]
-        df = self.dataset.get_dataframe(self.sensors).reset_index()
-        df = df.pivot(index='datetime', columns='variable', values='value').reset_index()
-        
-        # Detrend
-        df_mean_downsampled = df[['datetime']].merge(df_mean, how='left', on='datetime').interpolate(limit_direction='both')
-        df_detrended = df[sensor_names] - df_mean_downsampled[sensor_names]
-        df_detrended['datetime'] = df['datetime'].values
-        df = df_detrended.melt(id_vars='datetime', var_name='variable', value_name='value').reset_index()
+            detrended = engine.get_detrended(times, values, new_time_interval)
+        else:
+            detrended = values - engine.interpolate_rows(np.arange(len(times)), values, len(times))
+        df = melt_wide_frame(pd.DataFrame(detrended, index=wide.index, columns=wide.columns))
         return self.x_axis, self.y_axis, df
 
     def display_text(self):
@@ -114,16 +97,18 @@ class DetrendPreprocess:
 
 class RunningMeanPreprocess:
     def process(self):
-        df = self.dataset.get_dataframe(self.sensors).reset_index()
-        df = df.pivot(index='datetime', columns='variable', values='value')
         # Upsample only
         interval_in_seconds = self.quantity * {'s': 1, 'min': 60, 'h': 3600}[self.detrend_units]
-        time_in_seconds = df.reset_index()['datetime'].astype('int64') // 10**9
-        mean_time_interval = time_in_seconds.diff().mean() * 1000       
+        mean_time_interval = self.dataset.get_sample_interval(self.sensors) * 1000
         if mean_time_interval > interval_in_seconds:
+            # Bucket means come from the rollups where the dataset allows it
             new_time_interval = f"{self.quantity}{self.detrend_units}"
-            df = df.copy().reset_index().resample(new_time_interval, on='datetime').mean()
-        df = df.reset_index().melt(id_vars='datetime', var_name='variable', value_name='value').reset_index()
+            df = self.dataset.get_aggregates(self.sensors, new_time_interval)
+            df = pd.DataFrame({'datetime': df['datetime'],
+                               'variable': df['variable'],
+                               'value': df['value_sum'] / df['value_count']})
+        else:
+            df = self.dataset.get_dataframe(self.sensors)[['datetime', 'variable', 'value']]
         return self.x_axis, self.y_axis, df
     
     def display_text(self):
@@ -132,20 +117,13 @@ class RunningMeanPreprocess:
 
 class OccurrencePreprocess:
     def process(self):
-        df = self.dataset.get_dataframe(self.sensors)
-        df = df.pivot(index='datetime', columns='variable', values='value').reset_index()
-        series = []
-        for sensor in self.sensors:
-            in_limits = df[['datetime', sensor.name]][df[sensor.name].between(self.lower_limit, self.upper_limit)]
-            in_limits['day'] = in_limits['datetime'].dt.date
-            in_limits = in_limits.groupby('day').size()
-            series.append(in_limits)
-        df = pd.concat(series, axis=1)
-        df.columns = [sensor.name for sensor in self.sensors]
-        df.reset_index(inplace=True)
-        df = df.melt(id_vars='day', var_name='variable', value_name='value')
-        df.dropna(inplace=True)
-        df = df.reset_index()
+        wide = self.dataset.get_wide_frame(self.sensors)
+        days, counts = engine.get_daily_counts(wide.index.to_numpy(), wide.to_numpy(),
+                                               self.lower_limit, self.upper_limit)
+        # Days without any reading in the limits are left out
+        counts = np.where(counts > 0, counts, np.nan)
+        index = pd.Index(pd.DatetimeIndex(days).date, name='day')
+        df = melt_wide_frame(pd.DataFrame(counts, index=index, columns=wide.columns))
         return 'day', self.y_axis, df
 
     def display_text(self):
@@ -193,6 +171,9 @@ class VisualisationBehaviour:
         plot_type = plot_types.get(self.plot_format, StandardPlot)
         x_axis, y_axis, df = plot_type.process(self, x_axis, y_axis, df)
         labels = plot_type.get_labels(self)
+        # Line plots only need as many points per series as can be drawn
+        if plot_type is StandardPlot and self.plot_type != 'Scatter':
+            df = downsample(df, x_axis, y_axis, by=self.color)
 
 
         import plotly.express as px
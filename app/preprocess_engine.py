@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import numpy as np
+import pandas as pd
+
+''' Array operations shared by the preprocessors. They act on one
+    contiguous float32 matrix of readings (rows in datetime order, one
+    column per sensor) and its datetime64 row index, so every sensor is
+    handled in the same pass. Time bins are located once with
+    np.searchsorted and reduced with np.add.reduceat. '''
+
+
+def get_bins(times, freq):
+    ''' Start datetime and first row of every non-empty bin of width freq,
+        with bins counted from midnight of the first day like resample. '''
+    if len(times) == 0:
+        return times[:0], np.zeros(0, dtype=np.int64)
+    width = np.timedelta64(pd.Timedelta(freq).value, 'ns')
+    origin = times[0].astype('datetime64[D]').astype(times.dtype)
+    edges = np.arange(origin, times[-1] + np.timedelta64(1, 'ns'), width).astype(times.dtype)
+    starts = np.searchsorted(times, edges)
+    # reduceat repeats a row for an empty bin rather than giving zero, so drop them
+    non_empty = np.diff(np.append(starts, len(times))) > 0
+    return edges[non_empty], starts[non_empty]
+
+def bin_sums(values, starts):
+    ''' Column sums of each bin, missing readings counted as zero. '''
+    return np.add.reduceat(np.nan_to_num(values), starts, axis=0, dtype=np.float64)
+
+def bin_counts(mask, starts):
+    ''' Number of true cells of each bin and column. '''
+    return np.add.reduceat(mask.astype(np.int64), starts, axis=0)
+
+def bin_means(values, starts):
+    ''' Column means of each bin ignoring missing readings. '''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (bin_sums(values, starts) / bin_counts(~np.isnan(values), starts)).astype(np.float32)
+
+def get_mean_interval(times):
+    ''' Mean number of seconds between consecutive rows. '''
+    if len(times) < 2:
+        return np.nan
+    return np.diff(times).astype('timedelta64[ns]').astype(np.int64).mean() / 1e9
+
+def interpolate_rows(positions, values, n_rows):
+    ''' Linear interpolation by row number of values known at the given
+        rows onto every row, holding the end values constant. '''
+    rows = np.arange(n_rows)
+    result = np.full((n_rows, values.shape[1]), np.nan, dtype=np.float32)
+    for column in range(values.shape[1]):
+        known = ~np.isnan(values[:, column])
+        if known.any():
+            result[:, column] = np.interp(rows, positions[known], values[known, column])
+    return result
+
+def get_ratios(values, reference):
+    ''' Every column divided by the reference column, non-finite ratios missing. '''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratios = values / reference[:, np.newaxis]
+    ratios[~np.isfinite(ratios)] = np.nan
+    return ratios
+
+def get_detrended(times, values, freq):
+    ''' Readings less their bin means interpolated back onto every row. '''
+    edges, starts = get_bins(times, freq)
+    means = bin_means(values, starts)
+    # Means are only placed on rows whose datetime is exactly a bin start
+    on_row = times[starts] == edges
+    trend = interpolate_rows(starts[on_row], means[on_row], len(times))
+    return values - trend
+
+def get_daily_counts(times, values, lower_limit, upper_limit):
+    ''' Days with readings and the number of readings of each column within the limits. '''
+    days, starts = get_bins(times, '1D')
+    in_limits = (values >= lower_limit) & (values <= upper_limit)
+    return days, bin_counts(in_limits, starts)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import numpy as np
+import pandas as pd
+
+''' Holds the readings of a trial that is being set up. Rather than a
+    long format frame with a string per reading, the readings are kept as
+    three arrays: UTC datetimes as int64 nanoseconds since the epoch,
+    variables as int32 codes into a list of names and float32 values. '''
+
+
+def get_first_of_repeats(times, codes):
+    ''' Positions of the readings in (datetime, variable) order, keeping only
+        the first of any repeated datetime and variable. '''
+    order = np.lexsort((codes, times))
+    times, codes = times[order], codes[order]
+    repeated = np.zeros(len(order), dtype=bool)
+    repeated[1:] = (times[1:] == times[:-1]) & (codes[1:] == codes[:-1])
+    return order[~repeated]
+
+
+class StagedReadings:
+
+    def __init__(self, times, codes, values, names):
+        self.times = times
+        self.codes = codes
+        self.values = values
+        self.names = names
+
+    @classmethod
+    def from_frame(cls, df):
+        ''' Stages long format readings (datetime, variable, value). '''
+        codes, names = pd.factorize(df['variable'])
+        times = pd.to_datetime(df['datetime'], utc=True).dt.tz_localize(None)
+        return cls(times.to_numpy(dtype='datetime64[ns]').view('int64'),
+                   codes.astype(np.int32),
+                   df['value'].to_numpy(dtype=np.float32),
+                   list(names))
+
+    def merge(self, other):
+        ''' Readings of both, keeping this one's reading of any repeated
+            datetime and variable. '''
+        names = self.names + [name for name in other.names if name not in self.names]
+        recode = np.array([names.index(name) for name in other.names], dtype=np.int32)
+        times = np.concatenate([self.times, other.times])
+        codes = np.concatenate([self.codes, recode[other.codes]])
+        values = np.concatenate([self.values, other.values])
+        keep = get_first_of_repeats(times, codes)
+        return StagedReadings(times[keep], codes[keep], values[keep], names)
+
+    def __len__(self):
+        return len(self.times)
+
+    def get_names(self):
+        ''' Names of the variables with at least one reading. '''
+        present = np.bincount(self.codes, minlength=len(self.names)) > 0
+        return [name for name, has_readings in zip(self.names, present) if has_readings]
+
+    def get_start_datetime(self):
+        return pd.Timestamp(self.times.min(), tz='UTC').to_pydatetime()
+
+    def get_end_datetime(self):
+        return pd.Timestamp(self.times.max(), tz='UTC').to_pydatetime()
+
+    def to_frame(self):
+        ''' Long format readings with a categorical variable column, for submission. '''
+        return pd.DataFrame({'datetime': pd.to_datetime(self.times, utc=True),
+                             'variable': pd.Categorical.from_codes(self.codes, categories=self.names),
+                             'value': self.values})
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import os
+import datetime
+import threading
+import pandas as pd
+
+''' Keeps archive weather readings on disk so that a site and period is
+    only downloaded once. Hourly UTC readings are stored in one Parquet
+    file per grid cell, named by the cell centre, and a request only
+    fetches the runs of dates that the cell does not hold yet. Archive data
+    for past dates never changes, but the most recent days are still being
+    filled in, so these are returned without being stored. '''
+
+STORE_DIR = os.path.join('cache', 'weather')
+GRID_DEGREES = 0.1
+# Days before today that the archive may still revise
+ARCHIVE_DELAY_DAYS = 7
+
+
+def get_cell(latitude, longitude):
+    ''' Centre of the grid cell holding the coordinates. '''
+    return (round(round(latitude / GRID_DEGREES) * GRID_DEGREES, 6),
+            round(round(longitude / GRID_DEGREES) * GRID_DEGREES, 6))
+
+def get_path(cell):
+    latitude, longitude = cell
+    return os.path.join(STORE_DIR, f"{latitude:+.4f}_{longitude:+.4f}.parquet")
+
+def load_cell(cell):
+    path = get_path(cell)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except (ImportError, OSError, ValueError):
+        return None
+
+def store_cell(cell, df):
+    ''' Writes to a temporary file first so readers never see a partial file. '''
+    path = get_path(cell)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(STORE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except (ImportError, OSError, ValueError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def get_utc_day(value):
+    ''' Midnight UTC of the day of a date or datetime, naive or aware. '''
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+    return timestamp.normalize()
+
+def get_missing_ranges(stored_days, start_day, end_day):
+    ''' (first, last) days of each run of days from the start to the end that is not stored. '''
+    days = pd.date_range(start_day, end_day, freq='D')
+    ranges = []
+    for day in days[~days.isin(stored_days)]:
+        if ranges and day - ranges[-1][1] == pd.Timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [(first, last) for first, last in ranges]
+
+def merge_readings(*frames):
+    ''' Readings of every frame in datetime order, later frames replacing repeated hours. '''
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    return df.drop_duplicates('datetime', keep='last').sort_values('datetime', ignore_index=True)
+
+def get_weather(latitude, longitude, start_date, end_date, fetch):
+    ''' Hourly readings of the grid cell of the coordinates from the start to
+        the end date. Missing days are read with fetch(latitude, longitude,
+        first_day, last_day), which returns hourly UTC readings with a
+        datetime column. '''
+    cell = get_cell(latitude, longitude)
+    start_day, end_day = get_utc_day(start_date), get_utc_day(end_date)
+    stored = load_cell(cell)
+    stored_days = [] if stored is None else stored['datetime'].dt.tz_convert('UTC').dt.tz_localize(None).dt.normalize().unique()
+    fetched = merge_readings(*[fetch(*cell, first, last)
+                               for first, last in get_missing_ranges(stored_days, start_day, end_day)])
+    if fetched is not None:
+        settled = pd.Timestamp(datetime.date.today() - datetime.timedelta(days=ARCHIVE_DELAY_DAYS), tz='UTC')
+        settled_readings = fetched[fetched['datetime'] < settled]
+        if not settled_readings.empty:
+            store_cell(cell, merge_readings(stored, settled_readings))
+    df = merge_readings(stored, fetched)
+    if df is None:
+        return None
+    start, end = pd.Timestamp(start_day, tz='UTC'), pd.Timestamp(end_day + pd.Timedelta(days=1), tz='UTC')
+    return df[(df['datetime'] >= start) & (df['datetime'] < end)].reset_index(drop=True)
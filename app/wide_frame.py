@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import numpy as np
+import pandas as pd
+
+''' Converts measurements between the long format returned by the
+    database queries (datetime, variable, value) and an aligned datetime
+    by variable float32 matrix. Both directions are a single NumPy
+    scatter or gather rather than a pandas pivot or melt. '''
+
+
+def get_sensor_label(sensor):
+    ''' The variable label given to the sensor by the measurement queries. '''
+    return sensor.name if sensor.display_name is None else sensor.display_name
+
+def make_wide_frame(df, columns):
+    ''' Scatters long format readings into a datetime by variable frame.
+        Rows must be in datetime order, as the measurement queries return them. '''
+    codes = pd.Categorical(df['variable'], categories=columns).codes
+    keep = codes >= 0
+    times = df['datetime'].to_numpy()[keep]
+    # A new row of the matrix starts wherever the datetime changes
+    new_time = np.ones(len(times), dtype=bool)
+    new_time[1:] = times[1:] != times[:-1]
+    rows = np.cumsum(new_time) - 1
+    values = np.full((int(new_time.sum()), len(columns)), np.nan, dtype='float32')
+    values[rows, codes[keep]] = df['value'].to_numpy(dtype='float32')[keep]
+    index = pd.DatetimeIndex(times[new_time], name='datetime')
+    return pd.DataFrame(values, index=index, columns=pd.Index(columns, name='variable'))
+
+def melt_wide_frame(wide):
+    ''' Long format rows (index, variable, value) of the non-missing cells. '''
+    n_rows, n_columns = wide.shape
+    values = wide.to_numpy().ravel()
+    keep = ~np.isnan(values)
+    index = np.repeat(wide.index.to_numpy(), n_columns)[keep]
+    variables = np.tile(wide.columns.to_numpy(dtype=object), n_rows)[keep]
+    return pd.DataFrame({wide.index.name: index, 'variable': variables, 'value': values[keep]})
@@ -6,10 +6,16 @@
 import streamlit as st
 import pandas as pd
 from gui.custom_components.selectable_data_editor import selectable_data_editor
+from app.dataframe_retriever import get_sort_order
 
 ''' Creates a streamlit table that paginates a database table. '''
 
 
+@st.cache_data(max_entries=8)
+def get_cached_sort_order(df, by, ascending):
+    # Keyed by the frame contents, so a frame rebuilt on a rerun reuses its sort
+    return get_sort_order(df, by, ascending)
+
 def paginated_selectable_data_editor(retriever, *pargs, **kwargs):
     if retriever.get_row_count() == 0:
         st.warning("Nothing here yet. Use the left menu to add new data.")
@@ -50,5 +56,6 @@ if __name__ == '__main__':
     file_path = st.file_uploader("Select CSV file to upload", type=["csv"])
     if file_path:
         df = pd.read_csv(file_path)
-        selected_row = selectable_data_editor(DataFrameRetriever(df), hide_index=True)
+        selected_row = paginated_selectable_data_editor(
+            DataFrameRetriever(df, sort_order=get_cached_sort_order), hide_index=True)
         print(selected_row)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import functools
+from contextlib import contextmanager
+import streamlit as st
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker, Session, InstanceState
+from app.db.settings import DATABASE_URL, POOL_SIZE, MAX_OVERFLOW, \
+                            POOL_TIMEOUT, POOL_RECYCLE
+
+''' Provides the database session of each script run. The session is kept
+    in st.session_state.db_session while the run lasts and is closed and
+    removed when it ends. Dialogs are fragments, so clicking inside one
+    reruns only the dialog, after the session of the run that opened it has
+    closed. Dialogs made with session_dialog open their own session for
+    these reruns and load their arguments into it. '''
+
+
+@st.cache_resource
+def get_session_factory(db_path):
+    ''' One pooled engine for the whole app, shared by every browser session. '''
+    engine = create_engine(db_path,
+                           pool_size=POOL_SIZE,
+                           max_overflow=MAX_OVERFLOW,
+                           pool_timeout=POOL_TIMEOUT,
+                           pool_recycle=POOL_RECYCLE,
+                           pool_pre_ping=True)
+    # Objects stay readable after a commit so they can be carried to the next run
+    return sessionmaker(bind=engine, expire_on_commit=False)
+
+def reattach(session, items):
+    ''' Loads ORM objects kept from an earlier script run into this run's
+        session, leaving out any that have since been deleted. '''
+    identities = [(type(item), inspect(item).identity) for item in items]
+    items = [session.get(cls, identity) for cls, identity in identities if identity is not None]
+    return [item for item in items if item is not None]
+
+def reattach_value(session, value):
+    ''' The value with sessions swapped for the given one and stored ORM
+        objects loaded into it. Lists leave out objects since deleted. '''
+    if isinstance(value, Session):
+        return session
+    if isinstance(value, (list, tuple)):
+        items = [(item, reattach_value(session, item)) for item in value]
+        return type(value)(new for old, new in items if new is not None or old is None)
+    state = inspect(value, raiseerr=False)
+    if isinstance(state, InstanceState) and state.identity is not None:
+        return session.get(type(value), state.identity)
+    return value
+
+@contextmanager
+def run_session():
+    ''' A new session for the run, with the menu selections loaded into it. '''
+    session = get_session_factory(DATABASE_URL)()
+    st.session_state.db_session = session
+    try:
+        if 'menu_tracking' in st.session_state:
+            st.session_state.menu_tracking = reattach(session, st.session_state.menu_tracking)
+        yield session
+    finally:
+        session.close()
+        del st.session_state.db_session
+
+def session_dialog(title, **kwargs):
+    ''' st.dialog that opens a session for each rerun of the dialog on its own. '''
+    def decorator(func):
+        @functools.wraps(func)
+        def run(*args, **func_kwargs):
+            if 'db_session' in st.session_state:
+                return func(*args, **func_kwargs)
+            with run_session() as session:
+                args = [reattach_value(session, arg) for arg in args]
+                func_kwargs = {key: reattach_value(session, value) for key, value in func_kwargs.items()}
+                return func(*args, **func_kwargs)
+        return st.dialog(title, **kwargs)(run)
+    return decorator
@@ -5,10 +5,11 @@
 
 import streamlit as st
 from sqlalchemy.exc import IntegrityError
+from gui.db_session import session_dialog
 
 ''' Provides a dialog for confirming deletion of an item. '''
 
-@st.dialog("Are you sure?")
+@session_dialog("Are you sure?")
 def check_delete(session, item):
     warning = st.warning("This will permanently delete the item and its stored data. Are you sure you wish to proceed?")
     col1, col2 = st.columns([1, 4])
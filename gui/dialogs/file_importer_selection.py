@@ -5,7 +5,7 @@
 
 import streamlit as st
 from gui.csv_importer import run_csv_importer
-from gui.file_importer import uploader_modal
+from gui.file_importer import uploader_modal, batch_uploader_modal
 
 ''' Provides a dialog for selecting the type of file importer to use. '''
 
@@ -14,11 +14,13 @@ def importer_type_selection():
 
     attach_mode = st.selectbox(
         "Select Sensor Readings",
-        options=["importer (manual)", "importer (auto-detect)"],)
+        options=["importer (manual)", "importer (auto-detect)", "batch importer (auto-detect)"],)
     
     if st.button("Confirm"):
         if attach_mode == "importer (manual)":
             st.session_state.reader_dialog = run_csv_importer
+        elif attach_mode == "batch importer (auto-detect)":
+            st.session_state.reader_dialog = batch_uploader_modal
         else:
             st.session_state.reader_dialog = uploader_modal
         st.rerun()
@@ -7,6 +7,7 @@ import streamlit as st
 import app.db.model as db
 from gui.sensor_filters import make_filters
 from gui.custom_components.stored_options import stored_multiselect, stored_selectbox
+from gui.db_session import session_dialog
 
 ''' Provides a dialog for creating new plots. '''
 
@@ -33,10 +34,9 @@ def make_time(dataset, project):
 
 def make_groupy(dataset, project):
     x_axis, group_key = select_sensors_groupy(dataset, project)
-    groups = [group for group in project.groups if group.key == group_key]
-    selected_sensor_lists = [group.sensors for group in groups]
-    selected_sensors = list(set([item for sublist in selected_sensor_lists for item in sublist]))
-    selected_sensors += [sensor for sensor in dataset.sensors if sensor.get_display_name() == x_axis]
+    group_sensor_ids = set(project.get_group_index().get_key_sensor_ids(group_key, dataset.trial_id))
+    selected_sensors = [sensor for sensor in dataset.sensors
+                        if sensor.id in group_sensor_ids or sensor.get_display_name() == x_axis]
     return {'x_axis': x_axis, 
             'y_axis': group_key, 
             'color': 'value',
@@ -150,11 +150,10 @@ def select_sensors_groupy(dataset, project):
     filtered_sensors = dataset.get_filtered_sensors(project, group_filters, sensor_filters, reference_filters)
     x_axis_sensors = [sensor.get_display_name() for sensor in filtered_sensors]
     x_axis = stored_selectbox('Select X-Axis', x_axis_sensors, unique_key='x_axis_selection')
-    unique_keys = list(set([group.key for group in project.groups]))
-    key = st.selectbox('Select Y-Axis Key', unique_keys)   
+    key = st.selectbox('Select Y-Axis Key', options)   
     return x_axis, key
 
-@st.dialog("Add new Plot")
+@session_dialog("Add new Plot")
 def new_plot(session, project):
 
     datasets = {dataset.name:dataset for dataset in project.datasets}
@@ -4,9 +4,11 @@
 """
 
 import streamlit as st
-from app.file_parser import detect_types
+from app.file_parser import detect_columns
 from app.util import gen_float_cols
 from app.file_importer import FileReaderBehaviours, CSVReaderBehaviours, ExcelReaderBehaviours
+from app.batch_import import get_filetype_behaviour, import_files
+from app.db.settings import IMPORT_WORKERS
 
 class FileReaderGUI(FileReaderBehaviours):
 
@@ -46,7 +48,8 @@ class FileReaderGUI(FileReaderBehaviours):
         else:
             df_raw = self.read_detection_preview(self.file, skiprows=skiprows)
 
-        types = list(detect_types(df_raw))
+        columns = list(detect_columns(df_raw))
+        types = [column_type for column_type, _ in columns]
 
         check1 = 'datetime' not in types
         check2 = not('date' in types and 'time' in types)
@@ -60,6 +63,8 @@ class FileReaderGUI(FileReaderBehaviours):
             else:
                 dt_col_names = (df_raw.columns[types.index('time')], )
             dt_col_indexes = [df_raw.columns.get_loc(name) for name in dt_col_names]
+            # Formats guessed from the preview are reused for the full file
+            dt_formats = tuple(columns[index][1] for index in dt_col_indexes)
 
             float_cols = list(gen_float_cols(df_raw, dt_col_indexes))
 
@@ -81,14 +86,14 @@ class FileReaderGUI(FileReaderBehaviours):
             # Preview the preprocessed data
             if len(dt_col_indexes) == 1:       
                 if selected_sheet is not None:
-                    df_preview = self.read_preview_with_datetime_column(self.file, *dt_col_indexes, usecols=usecol_indexes, skiprows=skiprows, sheet_name=selected_sheet)
+                    df_preview = self.read_preview_with_datetime_column(self.file, *dt_col_indexes, usecols=usecol_indexes, skiprows=skiprows, sheet_name=selected_sheet, formats=dt_formats)
                 else:
-                    df_preview = self.read_preview_with_datetime_column(self.file, *dt_col_indexes, usecols=usecol_indexes, skiprows=skiprows)
+                    df_preview = self.read_preview_with_datetime_column(self.file, *dt_col_indexes, usecols=usecol_indexes, skiprows=skiprows, formats=dt_formats)
             else:
                 if selected_sheet is not None:
-                    df_preview = self.read_preview_with_date_and_time_column(self.file, *dt_col_indexes, usecols=usecol_indexes, skiprows=skiprows, sheet_name=selected_sheet)
+                    df_preview = self.read_preview_with_date_and_time_column(self.file, *dt_col_indexes, usecols=usecol_indexes, skiprows=skiprows, sheet_name=selected_sheet, formats=dt_formats)
                 else:
-                    df_preview = self.read_preview_with_date_and_time_column(self.file, *dt_col_indexes, usecols=usecol_indexes, skiprows=skiprows)
+                    df_preview = self.read_preview_with_date_and_time_column(self.file, *dt_col_indexes, usecols=usecol_indexes, skiprows=skiprows, formats=dt_formats)
 
             st.dataframe(df_preview, hide_index=True)
 
@@ -101,7 +106,7 @@ class FileReaderGUI(FileReaderBehaviours):
 
             tz = st.radio("Timezone:",("Europe/London", "UTC"))
 
-            st.session_state.parameters = (self.file, skiprows, dt_col_indexes, usecol_indexes, tz)
+            st.session_state.parameters = (self.file, skiprows, dt_col_indexes, dt_formats, usecol_indexes, tz, selected_sheet)
 
 
 @st.dialog("Import Sensor Readings", width="large")
@@ -127,12 +132,50 @@ def uploader_modal():
             file_reader.start()
 
         if st.session_state.parameters is not None:
-            file, skiprows, dt_col_indexes, usecol_indexes, tz = st.session_state.parameters
+            file, skiprows, dt_col_indexes, dt_formats, usecol_indexes, tz, selected_sheet = st.session_state.parameters
             if len(usecol_indexes) > len(dt_col_indexes):
                 if st.button("Confirm"):
                     with st.spinner("Interpreting Full File..."):
-                        df = file_reader.read_full(file, *dt_col_indexes, usecols=usecol_indexes, skiprows=skiprows)
+                        if selected_sheet is not None:
+                            df = file_reader.read_full(file, *dt_col_indexes, formats=dt_formats, usecols=usecol_indexes, skiprows=skiprows, sheet_name=selected_sheet)
+                        else:
+                            df = file_reader.read_full(file, *dt_col_indexes, formats=dt_formats, usecols=usecol_indexes, skiprows=skiprows)
                         df['datetime'] = df['datetime'].dt.tz_localize(tz)
                         st.session_state.imported_file = df
                         st.rerun()
 
+
+@st.dialog("Import a Batch of Sensor Readings", width="large")
+def batch_uploader_modal():
+    ''' Function to display the modal for importing many files with the same layout '''
+
+    if 'parameters' not in st.session_state:
+        st.session_state.parameters = None
+    st.title('Select Files to Load and Preview')
+    st.write("All the files must share the layout of the first file, " \
+             "which is previewed below to detect the columns to import.")
+    files = st.file_uploader("Select the Files to Load - Preferred File Types .CSV and.TXT",
+                             type=['.csv', '.xlsx', '.xls', '.txt'], accept_multiple_files=True)
+    if files:
+        filetype_behaviour = get_filetype_behaviour(files[0].name)
+        if filetype_behaviour is None:
+            st.warning("Unsupported file format. Please provide CSV, TXT or Excel files.")
+            st.session_state.parameters = None
+        else:
+            FileReaderGUI(files[0], filetype_behaviour).start()
+
+        if st.session_state.parameters is not None:
+            _, skiprows, dt_col_indexes, dt_formats, usecol_indexes, tz, selected_sheet = st.session_state.parameters
+            if len(usecol_indexes) > len(dt_col_indexes):
+                if st.button("Confirm"):
+                    with st.spinner(f"Interpreting {len(files)} Files..."):
+                        df, failed = import_files([(file.name, file.getvalue()) for file in files],
+                                                  dt_col_indexes, dt_formats, usecol_indexes, skiprows, tz,
+                                                  sheet_name=selected_sheet, max_workers=IMPORT_WORKERS)
+                    if failed:
+                        st.error("❌ Could not read these files. Please check they match the first.")
+                        for name, reason in failed:
+                            st.write(f"{name}: {reason}")
+                    else:
+                        st.session_state.imported_batch = df
+                        st.rerun()
@@ -5,8 +5,9 @@
 
 import streamlit as st
 import app.db.model as db
+from gui.db_session import session_dialog
 
-@st.dialog("Image Upload", width='large')
+@session_dialog("Image Upload", width='large')
 def image_upload(session, trial):
     st.title("Image Gallery")
     # Drag-and-drop image upload
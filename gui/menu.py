@@ -7,6 +7,7 @@ import streamlit as st
 from sqlalchemy import inspect, select
 import app.db.model as db
 from app.backend import load_table
+from gui.db_session import session_dialog
 from datetime import datetime
 
 
@@ -34,7 +35,7 @@ def open_trial():
     menu_nav.navigate_to(trial)
     st.rerun()
 
-@st.dialog("New Dataset")
+@session_dialog("New Dataset")
 def new_dataset():
 
     st.write("Choose a trial and a specific range of interest. Once the Dataset has been created, options to exclude time periods of the data will be available.")
@@ -76,7 +77,7 @@ def new_dataset():
                 st.rerun()
 
 
-@st.dialog("New Project")
+@session_dialog("New Project")
 def new_project():
     session = st.session_state.db_session
     name = st.text_input("Project Name:")
@@ -12,10 +12,12 @@ from gui.custom_components.paginated_data_editor import paginated_selectable_dat
 from app.database_retriever import DatabaseRetriever
 from app.backend import get_dataset_by_name, clone_dataset
 from gui.menu import menu_nav
+from gui.db_session import session_dialog
 
 
-@st.dialog("Copy Dataset")
+@session_dialog("Copy Dataset")
 def copy_dataset():
+    session = st.session_state.db_session
     datasets_all = load_table(session, db.Dataset)
     dataset_names = {dataset.name: dataset for dataset in datasets_all}
     selected_dataset_name = st.selectbox("Select Dataset to copy from.", options=dataset_names.keys())
@@ -7,7 +7,9 @@ import streamlit as st
 import plotly.graph_objs as go
 import pandas as pd
 import plotly.express as px
+from app.downsample import downsample
 from gui.menu import menu_nav
+from gui.db_session import session_dialog, reattach
 
 
 def cache_plot(dataset, sensors, force_refresh=False):
@@ -20,6 +22,8 @@ def cache_plot(dataset, sensors, force_refresh=False):
         df = dataset.trial.get_dataframe(sensors)
         fig = None
         if not df.empty:
+            # Min/max buckets keep the spikes that exclusions are usually drawn around
+            df = downsample(df, 'datetime', 'value', by='variable', method='minmax')
             fig = px.line(df, x='datetime', y='value', color='variable')
             x_min, y_min = df['datetime'].min(), df['value'].min()
             markerPoint = go.Scatter(x=[x_min], y=[y_min], mode='lines+markers', showlegend=False, opacity=0)
@@ -33,8 +37,11 @@ def cache_plot(dataset, sensors, force_refresh=False):
         st.session_state.cache_exclusion_plot = (dataset.id, sensor_names, fig)
     return st.session_state.cache_exclusion_plot[2]
 
-@st.dialog("Select New Exclusions", width='large')
+@session_dialog("Select New Exclusions", width='large')
 def select_new_time_periods(dataset):
+    session = st.session_state.db_session
+    if st.session_state.selected_sensors is not None:
+        st.session_state.selected_sensors = reattach(session, st.session_state.selected_sensors)
 
     st.title(f"Trial: {dataset.trial.name}")
 
@@ -105,6 +112,8 @@ if hasattr(st.session_state, 'db_session'):
     #Initializing stored variables
     if 'selected_sensors' not in st.session_state:
         st.session_state.selected_sensors = None
+    elif st.session_state.selected_sensors is not None:
+        st.session_state.selected_sensors = reattach(session, st.session_state.selected_sensors)
 
     if 'fig' not in st.session_state:
         st.session_state.fig = None
@@ -168,6 +177,7 @@ if hasattr(st.session_state, 'db_session'):
 
         df = dataset.trial.get_dataframe(selected_sensors)
         if df is not None:
+            df = downsample(df, 'datetime', 'value', by='variable', method='minmax')
             fig = px.line(df, x='datetime', y='value', color='variable')
             y_min, y_max = df['value'].min(), df['value'].max()
             for start, stop in start_stops:     
@@ -182,9 +192,9 @@ if hasattr(st.session_state, 'db_session'):
             st.plotly_chart(fig)
 
         if placeholder.button('Save Changes'):
-            dataset.set_exclusions_df(stored_selections)
-
             try:
+                # Saving runs the bulk statements straight away, so invalid rows can fail here too
+                dataset.set_exclusions_df(stored_selections)
                 session.commit()
             except Exception as e:
                 print(e)
@@ -10,6 +10,7 @@ from gui.custom_components.selectable_data_editor import selectable_data_editor
 from gui.dialogs.deleter_dialog import check_delete
 from sqlalchemy.exc import IntegrityError
 from gui.menu import menu_nav
+from gui.db_session import session_dialog
 
 
 @st.dialog("Add new Key")
@@ -23,7 +24,7 @@ def new_key(existing_keys):
         st.session_state.additional_key_vals.append(key)
         st.rerun()
 
-@st.dialog("Copy Sensor Groups")
+@session_dialog("Copy Sensor Groups")
 def clone_metadata(project):
     st.write('Copy sensor groups from another project.')
     session = st.session_state.db_session
@@ -6,9 +6,10 @@
 import streamlit as st
 from gui.image_upload import image_upload
 from gui.menu import menu_nav
+from gui.db_session import session_dialog
 
 
-@st.dialog("Image Delete")
+@session_dialog("Image Delete")
 def delete_image(session, images):
     indexed_filenames = [f"{index + 1}: {image.name}" for index, image in enumerate(images)]
     selected = st.selectbox("Select an image to delete", indexed_filenames)
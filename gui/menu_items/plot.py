@@ -7,6 +7,7 @@ import app.db.model as db
 import streamlit as st
 from gui.dialogs.new_plot_dialog import new_plot
 from gui.menu import menu_nav
+from gui.db_session import session_dialog
 
 
 @st.cache_resource
@@ -20,7 +21,7 @@ def new_notepad(session, project):
     session.commit()
     st.rerun()
 
-@st.dialog("Delete Item")
+@session_dialog("Delete Item")
 def delete_item(session, project):
     items = {item.get_title(i + 1): item for i, item in enumerate(project.contents)}
     item_name = st.selectbox("Select Item to Delete", items.keys())
@@ -36,7 +37,7 @@ def delete_item(session, project):
             st.rerun()
 
 
-@st.dialog("Output CSV")
+@session_dialog("Output CSV")
 def output_csv(session, project):
     items = {item.get_title(i + 1): item for i, item in enumerate(project.contents) if item.content_table == 'visualisation'}
     item_name = st.selectbox("Select Item to Delete", items.keys())
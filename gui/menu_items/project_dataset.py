@@ -11,9 +11,11 @@ from gui.custom_components.paginated_data_editor import paginated_selectable_dat
 from app.database_retriever import DatabaseRetriever
 from app.backend import get_dataset_by_name, clone_dataset, remove_dataset_from_project
 from gui.menu import menu_nav
+from gui.db_session import session_dialog
 
-@st.dialog("Copy Dataset")
+@session_dialog("Copy Dataset")
 def copy_dataset(project):
+    session = st.session_state.db_session
     datasets_all = project.datasets
     dataset_names = {dataset.name: dataset for dataset in datasets_all}
     selected_dataset_name = st.selectbox("Select Dataset to copy from.", options=dataset_names.keys())
@@ -26,8 +28,9 @@ def copy_dataset(project):
                 session.commit()
                 st.rerun()
 
-@st.dialog("Add Dataset")
+@session_dialog("Add Dataset")
 def add_dataset(project):
+    session = st.session_state.db_session
     datasets_all = load_table(session, db.Dataset)
     if len(datasets_all) == 0:
         st.error("No datasets available. Please create a trial first.")
@@ -11,41 +11,28 @@ from datetime import datetime
 from gui.dialogs.file_importer_selection import importer_type_selection, run_selected_importer
 import pandas as pd
 from app.fetch_weather import fetch_weather_data  # Import the new fetch_weather.py module
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
 from sqlalchemy import select
 from gui.file_uploader import run_file_attach, attach_files_to_trial
 from gui.menu import menu_nav
+from app.batch_import import melt_readings
+from app.staged_readings import StagedReadings
+from app.geocoder import get_coordinates, normalise_postcode
 
 
-@st.cache_resource
-def get_coordinates(postcode):
-    # Geocoding function
-    geolocator = Nominatim(user_agent="streamlit-geocoder")
-    try:
-        location = geolocator.geocode(postcode)
-        if location:
-            return location.latitude, location.longitude
-    except (GeocoderTimedOut, GeocoderUnavailable):
-        pass
-    return None, None
-
 def get_metadata(session, type):
     qry = select(db.Metadata.value).where(db.Metadata.key == type).order_by(db.Metadata.value).distinct()
     return session.execute(qry).scalars().all()
 
-def append_df(df_existing, df): # Function to append imported readings to existing readings
-    if not df.empty:
-        df = df.set_index('datetime').tz_convert('UTC').reset_index()
-        df = df.rename(columns={'value': 'value_'}) # Rename if any columns are named value to avoid conflicts
-        df_melted = df.melt(id_vars='datetime', var_name='variable', value_name='value').dropna(subset=['value'])
-        if not df_melted.empty:
-            if st.session_state.imported_readings is None:
-                df_existing = df_melted
-            else:
-                df_existing = pd.concat([df_existing, df_melted], ignore_index=True)
-    if df_existing is not None:
-        return df_existing.drop_duplicates(subset=['datetime', 'variable'], keep='first')
+def stage_readings(staged, df): # Function to add long format readings to the staged readings
+    if df.empty:
+        return staged
+    new = StagedReadings.from_frame(df)
+    return new if staged is None else staged.merge(new)
+
+def append_df(staged, df): # Function to append imported readings to existing readings
+    if df.empty:
+        return staged
+    return stage_readings(staged, melt_readings(df))
 
 
 @st.dialog("Open Meteo Weather Data", width="large")
@@ -94,6 +81,8 @@ if hasattr(st.session_state, 'db_session'):
         st.session_state.lon = None
     if 'uploaded_files' not in st.session_state:
         st.session_state.uploaded_files = None
+    if 'imported_batch' not in st.session_state:
+        st.session_state.imported_batch = None
 
     st.title("Trial Setup")
 
@@ -105,12 +94,15 @@ if hasattr(st.session_state, 'db_session'):
     ## Trial inputs
     trial_name = st.text_input("Enter the Trial Name", placeholder="e.g. Greenhouse Test A")
     postcode = st.text_input("Enter the Postcode", placeholder="e.g. BS60 1QY (UK)")
-    st.session_state.lat, st.session_state.lon = get_coordinates(postcode)
-    
-    # Check the postcode validity with regex
+
+    # Check the postcode validity with regex, and geocode valid postcodes once each time they change
+    pattern = r"^[A-Z]{1,2}\d{1,2}[A-Z]?\s?\d[A-Z]{2}$"
+    validity = bool(postcode) and bool(re.match(pattern, postcode.upper()))
+    geocoded_postcode = normalise_postcode(postcode) if validity else None
+    if st.session_state.get('geocoded_postcode', None) != geocoded_postcode:
+        st.session_state.geocoded_postcode = geocoded_postcode
+        st.session_state.lat, st.session_state.lon = get_coordinates(postcode) if validity else (None, None)
     if postcode is not None and postcode != '':
-        pattern = r"^[A-Z]{1,2}\d{1,2}[A-Z]?\s?\d[A-Z]{2}$"
-        validity = bool(re.match(pattern, postcode.upper()))
         if not validity or st.session_state.lat is None or st.session_state.lon is None:
             st.error("❌ Either the postcode is not valid or the Geocoder service is down. "
                         "Weather data retrieval will not be possible."
@@ -158,10 +150,18 @@ if hasattr(st.session_state, 'db_session'):
     # Pass the imported file to the readings store
     if imported_file is not None:
         st.session_state.imported_readings = append_df(imported_readings, imported_file)
-        st.session_state.trial_start_datetime = st.session_state.imported_readings['datetime'].min().to_pydatetime()
-        st.session_state.trial_end_datetime = st.session_state.imported_readings['datetime'].max().to_pydatetime()
+        if st.session_state.imported_readings is not None:
+            st.session_state.trial_start_datetime = st.session_state.imported_readings.get_start_datetime()
+            st.session_state.trial_end_datetime = st.session_state.imported_readings.get_end_datetime()
         st.session_state.imported_file = None
 
+    # Pass the readings of a batch of files to the readings store
+    if st.session_state.imported_batch is not None:
+        st.session_state.imported_readings = stage_readings(imported_readings, st.session_state.imported_batch)
+        st.session_state.trial_start_datetime = st.session_state.imported_readings.get_start_datetime()
+        st.session_state.trial_end_datetime = st.session_state.imported_readings.get_end_datetime()
+        st.session_state.imported_batch = None
+
     # Pass the weather data to the readings store
     if st.session_state.weather_data is not None:
         st.session_state.imported_readings = append_df(imported_readings, weather_data)
@@ -172,15 +172,14 @@ if hasattr(st.session_state, 'db_session'):
         st.warning("No valid readings have been attached and the trial cannot yet be submitted. " )
     else:
 
-        df = st.session_state.imported_readings
-        num_rows = df.shape[0]
+        num_rows = len(st.session_state.imported_readings)
 
         # Button to fetch weather data
         if st.button("Fetch Weather Data"):
             weather_dialog(st.session_state.lat, st.session_state.lon, st.session_state.trial_start_datetime, st.session_state.trial_end_datetime)
 
         # Makes a map of the readings/sensors metadata
-        df = pd.DataFrame({'name': st.session_state.imported_readings['variable'].unique().copy()})
+        df = pd.DataFrame({'name': st.session_state.imported_readings.get_names()})
         df['display_name'] = None
 
         readings_map = st.data_editor(df.reset_index(drop=True), 
@@ -228,9 +227,10 @@ if hasattr(st.session_state, 'db_session'):
                     duplicate_names_str = ','.join(duplicate_names.tolist())
                     st.warning(f'Duplicate sensor display names found: [{duplicate_names_str}]')
                 else:
-                    trial = db.Trial(name=trial_name, postcode=postcode, notes=notes)
+                    trial = db.Trial(name=trial_name, postcode=postcode, notes=notes,
+                                     latitude=st.session_state.lat, longitude=st.session_state.lon)
                     try:
-                        trial.dataframe = st.session_state.imported_readings
+                        trial.dataframe = st.session_state.imported_readings.to_frame()
                     except (AssertionError, TypeError):
                         st.error("❌ Not all of the incoming readings were in the correct format. Please check the data and try again.")
                     else:
@@ -11,9 +11,11 @@ from gui.dialogs.deleter_dialog import check_delete
 from sqlalchemy import select
 import app.db.model as db
 from sqlalchemy.exc import IntegrityError
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
 from gui.menu import menu_nav
+from gui.db_session import session_dialog
+from gui.dialogs.file_importer_selection import importer_type_selection, run_selected_importer
+from app.backend import append_measurements
+from app.batch_import import melt_readings
 
 
 @st.cache_data
@@ -23,8 +25,9 @@ def add_selection_column(df):
         df['Download'] = "Download"
     return df
 
-@st.dialog("Upload FIles")
-def add_files():
+@session_dialog("Upload FIles")
+def add_files(trial):
+    session = st.session_state.db_session
     uploaded_files = st.file_uploader("Upload files", accept_multiple_files=True)
     if st.button("Submit"):
         if uploaded_files:
@@ -32,18 +35,6 @@ def add_files():
             session.commit()
             st.rerun()
 
-@st.cache_resource
-def get_coordinates(postcode):
-    # Geocoding function
-    geolocator = Nominatim(user_agent="streamlit-geocoder")
-    try:
-        location = geolocator.geocode(postcode)
-        if location:
-            return location.latitude, location.longitude
-    except (GeocoderTimedOut, GeocoderUnavailable):
-        pass
-    return None, None
-
 def get_metadata(session, type):
     qry = select(db.Metadata.value).where(db.Metadata.key == type).order_by(db.Metadata.value).distinct()
     return session.execute(qry).scalars().all()
@@ -55,6 +46,10 @@ if hasattr(st.session_state, 'db_session'):
 
     if 'uploaded_files_overview' not in st.session_state:
         st.session_state.uploaded_files_overview = None
+    if "imported_file" not in st.session_state:
+        st.session_state.imported_file = None
+    if 'imported_batch' not in st.session_state:
+        st.session_state.imported_batch = None
 
     trial = menu_nav.get_current_selection()
 
@@ -81,13 +76,40 @@ if hasattr(st.session_state, 'db_session'):
     with col2:
         st.text_input("End DateTime:", value=trial.end_datetime, disabled=True)
 
+    st.write("Readings from further logger files can be appended to the trial. "
+             "Readings already stored for a sensor at the same date/time are kept.")
+    if st.button("Append Readings"):
+        importer_type_selection() # Call the utility for choosing how to import readings
+
+    # Checks if an importer has been selected and runs it
+    run_selected_importer()
+
+    new_readings = None
+    if st.session_state.imported_file is not None:
+        new_readings = melt_readings(st.session_state.imported_file)
+        st.session_state.imported_file = None
+    if st.session_state.imported_batch is not None:
+        new_readings = st.session_state.imported_batch
+        st.session_state.imported_batch = None
+    if new_readings is not None:
+        try:
+            with st.spinner("Appending readings..."):
+                count = append_measurements(trial, new_readings)
+                session.commit()
+        except Exception as e:
+            print(e)
+            session.rollback()
+            st.error("❌ The readings could not be appended and nothing was saved. Please check the file and try again.")
+        else:
+            st.success(f"✅ {count} new readings appended.")
+
 
     col1, col2 = st.columns([3, 1], vertical_alignment="bottom")
     with col1:
         postcode = st.text_input("Postcode", value=trial.postcode)
     with col2:
         if st.button("Change"):
-            trial.postcode = postcode
+            trial.set_postcode(postcode)
             try:
                 session.commit()
             except IntegrityError:
@@ -97,7 +119,16 @@ if hasattr(st.session_state, 'db_session'):
                 st.success("✅ Saved Successfully!")
                 st.rerun()
 
-    st.session_state.lat, st.session_state.lon = get_coordinates(postcode)
+    # Trials saved before coordinates were stored are geocoded, once per session if not found
+    if 'geocoded_trials' not in st.session_state:
+        st.session_state.geocoded_trials = set()
+    if trial.postcode and trial.latitude is None and trial.id not in st.session_state.geocoded_trials:
+        st.session_state.geocoded_trials.add(trial.id)
+        trial.set_postcode(trial.postcode)
+        if trial.latitude is not None:
+            session.commit()
+    st.session_state.lat, st.session_state.lon = trial.latitude, trial.longitude
+    postcode = trial.postcode
 
     # Check the postcode validity with regex
     if postcode is not None and postcode != '':
@@ -144,7 +175,7 @@ if hasattr(st.session_state, 'db_session'):
                 check_delete(session, selected_file)
 
     if st.button("Add Files"):
-        add_files()   
+        add_files(trial)   
 
 
     st.title("Sensors")
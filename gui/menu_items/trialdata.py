@@ -5,6 +5,9 @@
 
 import plotly.express as px
 import streamlit as st
+from datetime import timedelta
+from app.downsample import downsample, POINT_BUDGET
+from app.db.rollups import choose_display_freq
 from gui.menu import menu_nav
 
 if hasattr(st.session_state, 'db_session'):
@@ -23,6 +26,16 @@ if hasattr(st.session_state, 'db_session'):
     with st.form("select_sensors"):
         selected_sensor_names = st.multiselect("Select sensors:", sensors_names.keys())
         selected_sensors = [sensors_names[name] for name in selected_sensor_names]
+        start_datetime, end_datetime = trial.start_datetime, trial.end_datetime
+        # Narrowing the window re-queries just that range at the full point budget.
+        # The slider needs a range, so trials without one are shown in full.
+        if start_datetime is not None and end_datetime is not None and start_datetime < end_datetime:
+            start_datetime, end_datetime = st.slider("Time Window:",
+                                        min_value=trial.start_datetime,
+                                        max_value=trial.end_datetime,
+                                        value=(trial.start_datetime, trial.end_datetime),
+                                        step=timedelta(minutes=1),
+                                        format="YYYY-MM-DD HH:mm")
 
         submit_button = st.form_submit_button("Submit")
 
@@ -34,6 +47,16 @@ if hasattr(st.session_state, 'db_session'):
             st.write("3. Drag diagonally to zoom in on a square.")
             st.write("4. Click on the legend to hide/show a sensor.")
 
-        df = trial.get_dataframe(selected_sensors)
+        # Long windows are drawn from bucket means of the rollups rather than raw readings
+        freq = None
+        if start_datetime is not None and end_datetime is not None:
+            freq = choose_display_freq(start_datetime, end_datetime, POINT_BUDGET)
+        if freq is None:
+            df = trial.get_dataframe(selected_sensors, start_datetime, end_datetime)
+            df = downsample(df, 'datetime', 'value', by='variable')
+        else:
+            df = trial.get_aggregates(selected_sensors, freq, start_datetime, end_datetime)
+            df['value'] = df['value_sum'] / df['value_count']
+            st.write(f"Showing the mean of each {freq} period. Narrow the time window for more detail.")
         fig = px.line(df, x='datetime', y='value', color='variable')
         st.plotly_chart(fig)
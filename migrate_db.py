@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Graham.Macleod
+"""
+
+import pandas as pd
+from sqlalchemy import create_engine, inspect, select, text
+import app.db.model as db
+from app.db.settings import DATABASE_URL
+
+''' Script to bring an existing database up to date with the model. '''
+
+
+def get_column_names(conn, table_name):
+    return [column['name'] for column in inspect(conn).get_columns(table_name)]
+
+def migrate_measurement(conn):
+    ''' Re-keys measurements stored by sensor name and trial onto sensor ids. '''
+    conn.execute(text("ALTER TABLE measurement RENAME TO measurement_legacy"))
+    db.Measurement.__table__.create(conn)
+    conn.execute(text(
+        "INSERT INTO measurement (sensor_id, datetime, value) "
+        "SELECT sensor.id, measurement_legacy.datetime, measurement_legacy.value "
+        "FROM measurement_legacy JOIN sensor "
+        "ON sensor.name = measurement_legacy.variable "
+        "AND sensor.trial_id = measurement_legacy.trial"))
+    conn.execute(text("DROP TABLE measurement_legacy"))
+    print('Migrated measurements to sensor ids.')
+
+def add_trial_coordinates(conn):
+    ''' Adds the postcode coordinates of trials, filled in when each trial is next viewed. '''
+    for column_name in ['latitude', 'longitude']:
+        conn.execute(text(f"ALTER TABLE trial ADD COLUMN {column_name} FLOAT"))
+    print('Added trial coordinates.')
+
+def build_rollups(conn):
+    ''' Builds the measurement rollups of every trial, thirty days at a time. '''
+    trials = conn.execute(select(db.Trial.id, db.Trial.start_datetime, db.Trial.end_datetime)).all()
+    for trial_id, start_datetime, end_datetime in trials:
+        if start_datetime is None or end_datetime is None:
+            continue
+        sensor_ids = conn.execute(select(db.Sensor.id).where(db.Sensor.trial_id == trial_id)).scalars().all()
+        window_starts = pd.date_range(pd.Timestamp(start_datetime).floor('1D'), end_datetime, freq='30D')
+        for window_start in window_starts:
+            window_end = min(window_start + pd.Timedelta('29D'), pd.Timestamp(end_datetime))
+            db.refresh_rollups(conn, sensor_ids, window_start, window_end)
+    print('Built measurement rollups.')
+
+
+def main():
+    engine = create_engine(DATABASE_URL)
+    with engine.begin() as conn:
+        if 'variable' in get_column_names(conn, 'measurement'):
+            migrate_measurement(conn)
+        if 'latitude' not in get_column_names(conn, 'trial'):
+            add_trial_coordinates(conn)
+        new_rollups = not inspect(conn).has_table('measurement_rollup')
+        # Create any tables added since the database was made
+        db.Base.metadata.create_all(conn)
+        if new_rollups:
+            build_rollups(conn)
+    engine.dispose()
+
+
+if __name__ == '__main__':
+
+    main()